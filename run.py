@@ -4,13 +4,48 @@ import textwrap
 
 sys.path.append('scripts/')
 from pipeline import *
+from metrics import select_metrics
+
+
+def shard(value):
+	"""
+	:param value: shard number and number of shards, str 'K/N'
+	:return: shard number and number of shards, tuple of int
+	"""
+	try:
+		number, total = [int(x) for x in value.split('/')]
+	except ValueError:
+		raise argparse.ArgumentTypeError('expected K/N, got {}'.format(value))
+	if not 1 <= number <= total:
+		raise argparse.ArgumentTypeError('expected 1 <= K <= N, got {}'.format(value))
+	return number, total
+
+
+def merge(argv):
+	parser = argparse.ArgumentParser(
+		prog='run.py merge',
+		description='Merges the outputs of the shards of a grid run into the files '
+		            'a run on one machine saves, after checking that every cell is '
+		            'there exactly once.')
+	parser.add_argument('partials', type=str, nargs='*',
+	                    help='metrics files of the shards, by default all the shard '
+	                         'files next to --output')
+	parser.add_argument("--output", type=str, default='result/grid.ndjson',
+	                    help='file the merged metrics are saved to, as given to the shards')
+	args = parser.parse_args(argv)
+	MergePipeline(args.output).run(args.partials)
 
 
 if __name__ == '__main__':
+	if sys.argv[1:2] == ['merge']:
+		merge(sys.argv[2:])
+		sys.exit()
+
 	parser = argparse.ArgumentParser(
 		formatter_class=argparse.RawDescriptionHelpFormatter,
 		description=textwrap.dedent('''\
-				USAGE: python run.py area.shp
+				USAGE: python run.py area.shp grid.shp
+				       python run.py merge [--output result/grid.ndjson]
 
 				------------------------------------------------------------------------
 
@@ -28,6 +63,46 @@ if __name__ == '__main__':
 	parser.add_argument('grid', type=str,
 	                    help='path to the grid shapefile to inspect', default=None)
 	parser.add_argument("--vis", action="store_true", help='visualize images')
+	parser.add_argument("--video", action="store_true",
+	                    help='with --vis, save one video per cell instead of a png per iteration')
+	parser.add_argument("--workers", type=int, default=1,
+	                    help='number of processes the grid cells are spread over')
+	parser.add_argument("--iteration-workers", type=int, default=1,
+	                    help='number of processes the iterations of a cell are spread over')
+	parser.add_argument("--streaming", action="store_true",
+	                    help='read the buildings of every cell from disk instead of '
+	                         'loading the whole shapefile')
+	parser.add_argument("--shard", type=shard, default=None,
+	                    help='K/N, run only the K-th of N shares of the grid cells; '
+	                         'the outputs are combined with "run.py merge"')
+	parser.add_argument("--queue-size", type=int, default=4,
+	                    help='number of cells queued between reading, computing and writing')
+	parser.add_argument("--output", type=str, default='result/grid.ndjson',
+	                    help='file the metrics of all the cells are saved to, '
+	                         '.ndjson or .parquet')
+	parser.add_argument("--export-csv", action="store_true",
+	                    help='also save the metrics of every cell to its own csv files')
+	parser.add_argument("--resume", action="store_true",
+	                    help='skip the cells the manifest of a previous run records as completed')
+	parser.add_argument("--profile", type=str, nargs='?', const='result/trace.json', default=None,
+	                    help='save a Chrome trace of the run, result/trace.json by default')
+	parser.add_argument("--metrics", type=str, nargs='+', default=None,
+	                    help='metrics to calculate, "all" for every metric, '
+	                         '"default" for the ones in config.METRICS')
+	parser.add_argument("--process-fields", type=str, nargs='+', default=None,
+	                    help='numeric metrics the process metrics are calculated over, '
+	                         'cluster_number and total_area by default')
+	parser.add_argument("--skip-heavy", action="store_true",
+	                    help='skip the metrics that need distances, centroids or clipped areas')
+	parser.add_argument("--engine", type=str, default='geometry',
+	                    choices=['geometry', 'dendrogram'],
+	                    help='dendrogram reads the cluster counts from the '
+	                         'single-linkage merge tree instead of the grown geometry')
+	parser.add_argument("--incremental", action="store_true",
+	                    help='grow the clusters of the previous iteration by one step '
+	                         'instead of the original footprints')
+	parser.add_argument("--membership", action="store_true",
+	                    help='save the cluster of every building on every iteration')
 
 	############################################################################
 
@@ -39,6 +114,50 @@ if __name__ == '__main__':
 
 	VIS = args.vis
 
+	VIDEO = args.video
+
+	WORKERS = args.workers
+
+	ITERATION_WORKERS = args.iteration_workers
+
+	ENGINE = args.engine
+
+	STREAMING = args.streaming
+
+	QUEUE_SIZE = args.queue_size
+
+	SHARD = args.shard
+
+	OUTPUT = args.output
+
+	EXPORT_CSV = args.export_csv
+
+	RESUME = args.resume
+
+	PROFILE = args.profile
+
+	METRIC_NAMES = select_metrics(args.metrics, args.skip_heavy)
+
+	PROCESS_FIELDS = args.process_fields
+
+	INCREMENTAL = args.incremental
+
+	MEMBERSHIP = args.membership
+
+	if PROFILE:
+		from profiler import Profiler
+		profiler = Profiler().install()
+
 	# pipe = MainPipeline(FILE)
-	pipe = GridPipeline(FILE)
-	pipe.run(GRID)
\ No newline at end of file
+	pipe = GridPipeline(FILE, value=int(VIS), workers=WORKERS, engine=ENGINE,
+	                    incremental=INCREMENTAL, membership=MEMBERSHIP,
+	                    iteration_workers=ITERATION_WORKERS, streaming=STREAMING,
+	                    output=OUTPUT, export_csv=EXPORT_CSV, resume=RESUME,
+	                    video=VIDEO, metrics=METRIC_NAMES, queue_size=QUEUE_SIZE,
+	                    shard=SHARD, process_fields=PROCESS_FIELDS)
+	pipe.run(GRID)
+
+	if PROFILE:
+		profiler.save(PROFILE)
+		for name, row in list(profiler.summary().items())[:10]:
+			print('{:40s} {:8d} calls {:10.3f} s'.format(name, row['calls'], row['seconds']))
\ No newline at end of file
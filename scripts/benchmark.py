@@ -0,0 +1,305 @@
+import argparse
+import geopandas as gpd
+import json
+import numpy as np
+import os
+import pickle
+import shapely
+from shapely.geometry import box
+import sys
+import tempfile
+import textwrap
+from time import time
+
+sys.path.append('scripts/')
+from config import PROCESS_METRICS
+from grid import Grid, CellCalculator
+from metrics import MetricFactory, ProcessMetricFactory
+from polygon import Reader, Collection, Footprint, Uniter, ComponentUniter, Iteration, \
+	convex_hull
+from shared import SharedGeometries
+from synthetic import SyntheticCity
+from utils import geometry_array
+
+
+class Benchmark:
+	"""
+	Class that times a function over a number of repeats.
+	"""
+	def __init__(self, name, repeat=1):
+		"""
+		:param name: name of the benchmark, str
+		:param repeat: number of runs, the best one is kept, int
+		"""
+		self.name = name
+		self.repeat = repeat
+
+	def run(self, function, *args):
+		"""
+		:param function: function to time
+		:return: best wall time in seconds and the function output, tuple
+		"""
+		best, output = None, None
+		for _ in range(self.repeat):
+			start = time()
+			output = function(*args)
+			elapsed = time() - start
+			best = elapsed if best is None else min(best, elapsed)
+		return best, output
+
+
+def initial_merge_uniter(geometries):
+	collection = Collection(Footprint)
+	for geometry in geometries:
+		collection = Uniter().make(collection, Footprint(geometry))
+	return collection
+
+
+def initial_merge_strtree(geometries):
+	return ComponentUniter().merge(geometries)
+
+
+def benchmark_initial_merge(filename, repeat=1):
+	"""
+	Function that compares the Uniter and the STRtree initial merge on a shapefile
+	:param filename: path to the buildings shapefile, str
+	:param repeat: number of runs per path, int
+	:return: timings and cluster numbers, dict
+	"""
+	geometries = Reader().read(filename)
+	result = {'file': filename, 'buildings': len(geometries)}
+	for name, function in [('uniter', initial_merge_uniter),
+	                       ('strtree', initial_merge_strtree)]:
+		elapsed, collection = Benchmark(name, repeat).run(function, geometries)
+		result[name] = {'seconds': elapsed, 'clusters': len(collection)}
+	result['speedup'] = result['uniter']['seconds'] / max(result['strtree']['seconds'], 1e-9)
+	return result
+
+
+class ScalingBenchmark:
+	"""
+	Class that times the hot paths on synthetic cities of growing size and
+	fits the exponent of every scaling curve, the slope of log time over
+	log n, so that a path turning quadratic shows up as an exponent near 2.
+	Paths that are quadratic by design are only timed up to their limit.
+	"""
+	LIMITS = {'Uniter.make': 1000, 'distance_matrix': 2000}
+
+	def __init__(self, sizes=(10, 100, 1000, 10000), repeat=1, limits=None, **city):
+		"""
+		:param sizes: numbers of footprints, list of int
+		:param repeat: number of runs per path, the best one is kept, int
+		:param limits: largest size timed per path, dict {path: int}
+		:param city: SyntheticCity arguments other than n
+		"""
+		self.sizes = list(sizes)
+		self.repeat = repeat
+		self.limits = self.LIMITS if limits is None else limits
+		self.city = city
+
+	def run(self):
+		"""
+		:return: settings, timings per path and size, None above the limit,
+		and fitted exponents, dict
+		"""
+		timings = {}
+		for n in self.sizes:
+			for path, elapsed in self._time(n).items():
+				timings.setdefault(path, {})[n] = elapsed
+		timings = {path: [values.get(n) for n in self.sizes] for path, values in timings.items()}
+		return {'settings': dict(self.city, repeat=self.repeat, limits=self.limits),
+		        'sizes': self.sizes,
+		        'seconds': timings,
+		        'exponents': {path: self._exponent(values) for path, values in timings.items()}}
+
+	def _time(self, n):
+		geometries = SyntheticCity(n, **self.city).make()
+		result = {}
+		if n <= self.limits.get('Uniter.make', n):
+			result['Uniter.make'], _ = Benchmark('uniter', self.repeat).run(
+				initial_merge_uniter, geometries)
+		result['ComponentUniter.merge'], collection = Benchmark('merge', self.repeat).run(
+			initial_merge_strtree, geometries)
+		result['Iteration.make'], grown = Benchmark('iteration', self.repeat).run(
+			lambda: Iteration(collection, 1).make())
+		result['CellCalculator.get'] = self._time_cells(geometries)
+		args = {'initial_collection': collection, 'hull': convex_hull(collection)}
+		for name in MetricFactory().dict:
+			if n > self.limits.get(name, n):
+				continue
+			metric = MetricFactory().produce(name)
+			result[name], _ = Benchmark(name, self.repeat).run(
+				lambda: metric.calculate(grown, **dict(args, sample=args['hull'])))
+		values = self._process_values(n)
+		for name in PROCESS_METRICS:
+			metric = ProcessMetricFactory().produce(name)
+			result['process_{}'.format(name)], _ = Benchmark(name, self.repeat).run(
+				lambda: [metric.calculate(values, field=field)
+				         for field in ['cluster_number', 'total_area']])
+		return result
+
+	def _time_cells(self, geometries, cells=4):
+		"""
+		Function that assigns the footprints to a cells x cells grid and
+		builds the collection of every cell
+		:return: seconds, float
+		"""
+		xmin, ymin, xmax, ymax = shapely.total_bounds(geometry_array(geometries))
+		width, height = (xmax - xmin) / cells, (ymax - ymin) / cells
+		grid = [box(xmin + i * width, ymin + j * height,
+		            xmin + (i + 1) * width, ymin + (j + 1) * height)
+		        for i in range(cells) for j in range(cells)]
+		with tempfile.TemporaryDirectory() as folder:
+			filename = os.path.join(folder, 'grid.shp')
+			gpd.GeoDataFrame(geometry=grid, crs='EPSG:3857').to_file(filename)
+			_cellcalc = CellCalculator(Grid(filename))
+
+		def get():
+			assignment = _cellcalc.assign(geometries)
+			return [_cellcalc.get(geometries, i, ids) for i, ids in enumerate(assignment)]
+		elapsed, _ = Benchmark('cells', self.repeat).run(get)
+		return elapsed
+
+	def _process_values(self, n):
+		"""
+		Function that makes the per-iteration results of a run of n iterations,
+		with a cluster number that falls from n to 1 and a growing total area
+		:return: results by iteration, dict
+		"""
+		clusters = np.linspace(n, 1, n).astype(int)
+		return {i: {'cluster_number': int(clusters[i]), 'total_area': 100. * (i + 1)}
+		        for i in range(n)}
+
+	def _exponent(self, values):
+		points = [(n, x) for n, x in zip(self.sizes, values) if x is not None and x > 0]
+		if len(points) < 2:
+			return None
+		n, x = np.log(np.array(points)).T
+		return float(np.polyfit(n, x, 1)[0])
+
+
+class SerializationBenchmark:
+	"""
+	Class that measures what handing the buildings of every cell of a grid
+	to a worker process costs: the seconds to pickle the tasks in the parent,
+	to unpickle them and rebuild the buildings in the worker, and the bytes
+	sent. Tasks that carry their buildings are compared with tasks that
+	carry building ids into SharedGeometries, whose one-off encoding, with
+	making and freeing the block, is timed on its own.
+	"""
+	def __init__(self, sizes=(1000, 10000), cells=(4, 16), repeat=1, **city):
+		"""
+		:param sizes: numbers of footprints, list of int
+		:param cells: cells per side of the grids, list of int
+		:param repeat: number of runs per measure, the best one is kept, int
+		:param city: SyntheticCity arguments other than n
+		"""
+		self.sizes = list(sizes)
+		self.cells = list(cells)
+		self.repeat = repeat
+		self.city = city
+
+	def run(self):
+		"""
+		:return: settings and one row per size and grid, list of dict
+		"""
+		rows = []
+		for n in self.sizes:
+			city = SyntheticCity(n, **self.city)
+			geometries = city.make()
+			for cells in self.cells:
+				rows.append(dict(self._measure(geometries, city.extent(), cells),
+				                 buildings=n, cells=cells ** 2))
+		return {'settings': dict(self.city, repeat=self.repeat), 'results': rows}
+
+	def _measure(self, geometries, extent, cells):
+		side = extent / cells
+		grid = [box(i * side, j * side, (i + 1) * side, (j + 1) * side)
+		        for i in range(cells) for j in range(cells)]
+		tree = shapely.STRtree(geometry_array(geometries))
+		assignment = [np.sort(tree.query(x, predicate='intersects')) for x in grid]
+		result = {'assigned': int(sum(len(x) for x in assignment))}
+		tasks = [(i, ids, [geometries[k] for k in ids], grid[i])
+		         for i, ids in enumerate(assignment)]
+		result['pickled'] = self._transfer(tasks, lambda x: x[2])
+		elapsed, _ = Benchmark('encode', self.repeat).run(
+			lambda: SharedGeometries(geometries).close())
+		shared = SharedGeometries(geometries)
+		try:
+			tasks = [(i, ids, shared, grid[i]) for i, ids in enumerate(assignment)]
+			result['shared'] = self._transfer(tasks, lambda x: x[2].get(x[1]))
+			result['shared']['encode_seconds'] = elapsed
+			result['shared']['block_bytes'] = shared.block.size
+		finally:
+			shared.close()
+		return result
+
+	def _transfer(self, tasks, rebuild):
+		"""
+		:param tasks: tasks as the parent sends them, list of tuple
+		:param rebuild: function that gives the buildings of an unpickled task
+		:return: seconds to pickle, seconds to unpickle and rebuild, bytes, dict
+		"""
+		dumps, payloads = Benchmark('dumps', self.repeat).run(
+			lambda: [pickle.dumps(x, protocol=pickle.HIGHEST_PROTOCOL) for x in tasks])
+		loads, _ = Benchmark('loads', self.repeat).run(
+			lambda: [rebuild(pickle.loads(x)) for x in payloads])
+		return {'dumps_seconds': dumps, 'loads_seconds': loads,
+		        'bytes': int(sum(len(x) for x in payloads))}
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+		formatter_class=argparse.RawDescriptionHelpFormatter,
+		description=textwrap.dedent('''\
+				USAGE: python scripts/benchmark.py buildings.shp
+
+				------------------------------------------------------------------------
+
+				Benchmarks of the hot paths of the metrics calculation.
+
+				------------------------------------------------------------------------
+
+				'''))
+
+	parser.add_argument('filename', type=str, nargs='?',
+	                    default='grid_test/A020102_Buildings_Units.shp',
+	                    help='path to the buildings shapefile')
+	parser.add_argument('--repeat', type=int, default=1, help='number of runs per path')
+	parser.add_argument('--scaling', action='store_true',
+	                    help='time the hot paths on synthetic cities of growing size')
+	parser.add_argument('--serialization', action='store_true',
+	                    help='measure the cost of sending the buildings of every cell to '
+	                         'a worker, pickled or through shared memory')
+	parser.add_argument('--cells', type=int, nargs='+', default=[4, 16],
+	                    help='cells per side of the grids of --serialization')
+	parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000, 10000],
+	                    help='numbers of footprints of the synthetic cities')
+	parser.add_argument('--density', type=float, default=0.2,
+	                    help='covered share of the synthetic city')
+	parser.add_argument('--clustering', type=float, default=0.5,
+	                    help='share of footprints gathered around cluster centres')
+	parser.add_argument('--vertices', type=int, default=4,
+	                    help='number of vertices of every synthetic footprint')
+	parser.add_argument('--seed', type=int, default=0, help='random seed')
+	parser.add_argument('--output', type=str, default=None,
+	                    help='path to save the json report')
+
+	############################################################################
+
+	args = parser.parse_args()
+
+	if args.serialization:
+		report = SerializationBenchmark(args.sizes, args.cells, args.repeat,
+		                                density=args.density, clustering=args.clustering,
+		                                vertices=args.vertices, seed=args.seed).run()
+	elif args.scaling:
+		report = ScalingBenchmark(args.sizes, args.repeat, density=args.density,
+		                          clustering=args.clustering, vertices=args.vertices,
+		                          seed=args.seed).run()
+	else:
+		report = benchmark_initial_merge(args.filename, args.repeat)
+	print(json.dumps(report, indent=2))
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=2)
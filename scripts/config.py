@@ -9,3 +9,14 @@ PROCESS_METRICS = ['xy', 'total_sum', 'total_nr_sum',
                    'max_variation', 'iter_max_variation',
                    'clusters_reduction_distance']
 CANVAS = (600, 600)
+# Buffer used to grow the footprints: segments per quarter circle and join style
+BUFFER_QUAD_SEGS = 16
+BUFFER_JOIN_STYLE = 'round'
+# Applied to the clusters after every iteration when set: precision grid size and
+# topology-preserving simplification tolerance, in map units
+PRECISION_GRID = None
+SIMPLIFY_TOLERANCE = None
+# Store distance_matrix as the float32 upper triangle, row by row, instead of the full matrix
+DISTANCE_MATRIX_CONDENSED = True
+# Simplification applied after every step of the incremental growth, in map units
+INCREMENTAL_TOLERANCE = 0.001
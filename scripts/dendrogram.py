@@ -0,0 +1,142 @@
+import math
+import numpy as np
+import shapely
+import sys
+
+sys.path.append('scripts/')
+from metrics import h_index
+from polygon import Collection, Footprint, polygon_array
+from utils import UnionFind
+
+
+class Dendrogram:
+	"""
+	Single-linkage merge tree of a collection.
+	Growing every footprint by i makes two clusters touch as soon as their
+	edge-to-edge distance d is at most 2 * i, so they join at iteration
+	ceil(d / 2). The clusters of every iteration are therefore the components
+	of the minimum spanning tree after dropping the edges longer than 2 * i,
+	and the count-based metrics can be read from the tree without growing
+	any geometry.
+	"""
+	METRICS = ['cluster_number', 'Dlimit', 'minimum_cluster_distance', 'hindex']
+
+	def __init__(self, collection):
+		"""
+		:param collection: collection of Footprints, Collection
+		"""
+		if not isinstance(collection, Collection):
+			print("Expected collection to be Collection, got {}".format(type(collection)))
+			raise TypeError
+		polygons = polygon_array(collection)
+		empty = np.flatnonzero(shapely.is_empty(polygons))
+		if len(empty) > 0:
+			print('Empty footprints cannot be linked, got {}'.format(empty.tolist()))
+			raise ValueError
+		self.n = len(collection)
+		self.edges, self.weights = self._build(polygons)
+
+	def _build(self, polygons):
+		"""
+		Function that builds the minimum spanning tree with Kruskal's algorithm.
+		Candidate pairs come from an STRtree query within a search radius that
+		doubles until the tree connects all the footprints. Any two footprints
+		are closer than the diagonal of the data, so the search stops once the
+		radius has covered it.
+		:param polygons: footprints, np.array of Polygon
+		:return: tree edges sorted by length and their lengths, tuple of np.array
+		"""
+		edges, weights = [], []
+		if self.n < 2:
+			return np.zeros((0, 2), dtype=np.int64), np.zeros(0)
+		tree = shapely.STRtree(polygons)
+		union_find = UnionFind(self.n)
+		_, nearest = tree.query_nearest(polygons, exclusive=True, return_distance=True,
+		                                all_matches=False)
+		previous, radius = -1., max(float(np.max(nearest)), 1.)
+		minx, miny, maxx, maxy = shapely.total_bounds(polygons)
+		extent = math.hypot(maxx - minx, maxy - miny)
+		while len(edges) < self.n - 1:
+			if previous >= extent:
+				print('Footprints could not be linked within {}, the extent of the data'.format(
+					extent))
+				raise ValueError
+			left, right = tree.query(polygons, predicate='dwithin', distance=radius)
+			left, right = left[left < right], right[left < right]
+			roots = np.array([union_find.find(i) for i in range(self.n)])
+			cross = roots[left] != roots[right]
+			left, right = left[cross], right[cross]
+			distance = shapely.distance(polygons[left], polygons[right])
+			new = distance > previous
+			left, right, distance = left[new], right[new], distance[new]
+			for k in np.argsort(distance, kind='stable'):
+				if union_find.union(int(left[k]), int(right[k])):
+					edges.append((left[k], right[k]))
+					weights.append(distance[k])
+			previous, radius = radius, radius * 2
+		return np.array(edges, dtype=np.int64), np.array(weights)
+
+	def n_iterations(self):
+		"""
+		Function that finds the first iteration with a unique cluster
+		:return: iteration number, int
+		"""
+		if len(self.weights) == 0:
+			return 0
+		return int(math.ceil(np.max(self.weights) / 2))
+
+	def _merged(self, value):
+		return self.weights <= 2 * value
+
+	def labels(self, value):
+		"""
+		Function that assigns every footprint to its cluster on a given iteration
+		:param value: buffer value of the iteration, int or float
+		:return: cluster label of each footprint, np.array of int
+		"""
+		union_find = UnionFind(self.n)
+		for i, j in self.edges[self._merged(value)].tolist():
+			union_find.union(i, j)
+		return union_find.labels()
+
+	def cluster_number(self, value):
+		return self.n - int(np.sum(self._merged(value)))
+
+	def minimum_cluster_distance(self, value):
+		weights = self.weights[~self._merged(value)]
+		if len(weights) == 0:
+			return 0
+		return np.min(weights) - 2 * value
+
+	def dlimit(self, value):
+		"""
+		The closest other cluster of a cluster is always reached through a tree
+		edge, so the distance is the shortest tree edge leaving the cluster.
+		"""
+		open_edges = ~self._merged(value)
+		if not np.any(open_edges):
+			return 0
+		labels = self.labels(value)
+		closest = np.full(np.max(labels) + 1, np.inf)
+		edges, weights = self.edges[open_edges], self.weights[open_edges] - 2 * value
+		np.minimum.at(closest, labels[edges[:, 0]], weights)
+		np.minimum.at(closest, labels[edges[:, 1]], weights)
+		return np.max(closest) / 2
+
+	def hindex(self, value):
+		return h_index(np.bincount(self.labels(value)))
+
+	def calculate(self, value, metrics=None):
+		"""
+		Function that calculates the metrics of an iteration
+		:param value: buffer value of the iteration, int or float
+		:param metrics: names of the metrics, Dendrogram.METRICS by default
+		:return: metric values, dict
+		"""
+		if metrics is None:
+			metrics = self.METRICS
+		functions = {'cluster_number': self.cluster_number,
+		             'Dlimit': self.dlimit,
+		             'minimum_cluster_distance': self.minimum_cluster_distance,
+		             'hindex': self.hindex}
+		return {metric: functions[metric](value) for metric in metrics}
@@ -0,0 +1,68 @@
+import unittest
+import numpy as np
+from shapely.geometry import Polygon
+import sys
+sys.path.append('scripts/')
+from dendrogram import Dendrogram
+from metrics import DlimitMetric, HindexMetric, MinimumClusterDistanceMetric
+from polygon import Collection, Footprint, Iteration
+
+
+class DendrogramTest(unittest.TestCase):
+	"""
+	Tests for the single-linkage merge tree
+	"""
+	def _collection(self):
+		collection = Collection(Footprint)
+		collection.add(Footprint(Polygon([(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)])))
+		collection.add(Footprint(Polygon([(10, 0), (10, 1), (11, 1), (11, 0), (10, 0)])))
+		collection.add(Footprint(Polygon([(0, 3), (0, 4), (1, 4), (1, 3), (0, 3)])))
+		collection.add(Footprint(Polygon([(3, 0), (3, 1), (4, 1), (4, 0), (3, 0)])))
+		collection.add(Footprint(Polygon([(30, 0), (30, 1), (31, 1), (31, 0), (30, 0)])))
+		return collection
+
+	def test_tree_edges(self):
+		tree = Dendrogram(self._collection())
+		self.assertEqual(len(tree.edges), 4)
+		self.assertEqual(sorted(tree.weights.tolist()), [2, 2, 6, 19])
+
+	def test_n_iterations(self):
+		self.assertEqual(Dendrogram(self._collection()).n_iterations(), 10)
+
+	def test_single_footprint(self):
+		collection = Collection(Footprint)
+		collection.add(Footprint(Polygon([(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)])))
+		tree = Dendrogram(collection)
+		self.assertEqual(tree.n_iterations(), 0)
+		self.assertEqual(tree.cluster_number(1), 1)
+		self.assertEqual(tree.dlimit(1), 0)
+
+	def test_empty_footprint(self):
+		collection = self._collection()
+		collection.add(Footprint(Polygon()))
+		with self.assertRaises(ValueError):
+			Dendrogram(collection)
+
+	def test_unlinked_footprints(self):
+		tree = Dendrogram(self._collection())
+		polygons = np.array([x.polygon for x in self._collection()] + [Polygon()], dtype=object)
+		tree.n = len(polygons)
+		with self.assertRaises(ValueError):
+			tree._build(polygons)
+
+	def test_matches_geometry(self):
+		collection = self._collection()
+		tree = Dendrogram(collection)
+		for value in range(0, 11):
+			grown = Iteration(collection, value).make() if value else collection
+			result = tree.calculate(value)
+			self.assertEqual(result['cluster_number'], len(grown))
+			self.assertEqual(result['hindex'], HindexMetric().calculate(
+				grown, initial_collection=collection))
+			self.assertAlmostEqual(result['Dlimit'], DlimitMetric().calculate(grown))
+			self.assertAlmostEqual(result['minimum_cluster_distance'],
+			                       MinimumClusterDistanceMetric().calculate(grown))
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
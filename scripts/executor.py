@@ -0,0 +1,176 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from queue import Queue
+from threading import Thread
+
+
+class Executor:
+	"""
+	Class that runs a function over a sequence of tasks.
+	Results are always returned in the order of the tasks. The initializer
+	is called with initargs once in every process that runs tasks, before
+	its first task, so that what all the tasks share is sent once per
+	process instead of once per task.
+	"""
+	def __init__(self, workers=1, initializer=None, initargs=()):
+		"""
+		:param workers: number of worker processes, int
+		:param initializer: function called before the first task, function
+		:param initargs: arguments of the initializer, tuple
+		"""
+		if not isinstance(workers, int) or workers < 1:
+			print('Expected a positive number of workers, got {}'.format(workers))
+			raise ValueError
+		self.name = 'generic'
+		self.workers = workers
+		self.initializer = initializer
+		self.initargs = initargs
+
+	def map(self, function, tasks):
+		return self._map(function, tasks)
+
+	def _map(self, function, tasks):
+		return iter([])
+
+
+class SerialExecutor(Executor):
+	"""
+	Executor that runs the tasks one after another in the current process.
+	"""
+	def __init__(self, initializer=None, initargs=()):
+		Executor.__init__(self, 1, initializer, initargs)
+		self.name = 'serial'
+
+	def _map(self, function, tasks):
+		if self.initializer is not None:
+			self.initializer(*self.initargs)
+		for task in tasks:
+			yield function(task)
+
+
+class PoolExecutor(Executor):
+	"""
+	Executor that fans the tasks out to a pool of worker processes.
+	At most maxtasks tasks are submitted at a time, the next task is only
+	taken once the oldest result has been handed over, so that a lazy task
+	sequence is not read to the end up front. Once the results stop being
+	taken, the tasks that have not started are cancelled.
+	"""
+	def __init__(self, workers, maxtasks=None, initializer=None, initargs=()):
+		"""
+		:param workers: number of worker processes, int
+		:param maxtasks: number of tasks in flight, twice the workers by default, int
+		:param initializer: function called in every worker before its first task, function
+		:param initargs: arguments of the initializer, tuple
+		"""
+		Executor.__init__(self, workers, initializer, initargs)
+		self.name = 'pool'
+		self.maxtasks = 2 * workers if maxtasks is None else maxtasks
+
+	def _map(self, function, tasks):
+		with ProcessPoolExecutor(max_workers=self.workers, initializer=self.initializer,
+		                         initargs=self.initargs) as pool:
+			pending = deque()
+			try:
+				for task in tasks:
+					pending.append(pool.submit(function, task))
+					if len(pending) >= self.maxtasks:
+						yield pending.popleft().result()
+				while pending:
+					yield pending.popleft().result()
+			finally:
+				for future in pending:
+					future.cancel()
+
+
+class ExecutorFactory:
+	def produce(self, workers: int=1, maxtasks=None, initializer=None, initargs=()):
+		if workers > 1:
+			return PoolExecutor(workers, maxtasks, initializer, initargs)
+		return SerialExecutor(initializer, initargs)
+
+
+class Prefetcher:
+	"""
+	Iterator that runs a task sequence on a background thread and keeps up
+	to maxsize of its items ready in a queue. The thread waits while the
+	queue is full. An error of the sequence is raised where the item would
+	have been taken.
+	"""
+	def __init__(self, tasks, maxsize=4):
+		"""
+		:param tasks: task sequence, iterable
+		:param maxsize: number of items kept ready, int
+		"""
+		self.queue = Queue(maxsize=maxsize)
+		self.thread = Thread(target=self._work, args=(tasks,), daemon=True)
+		self.thread.start()
+
+	def __iter__(self):
+		return self
+
+	def __next__(self):
+		item, error = self.queue.get()
+		if error is not None:
+			raise error
+		if item is _DONE:
+			self.queue.put((_DONE, None))
+			raise StopIteration()
+		return item
+
+	def _work(self, tasks):
+		try:
+			for item in tasks:
+				self.queue.put((item, None))
+		except Exception as e:
+			self.queue.put((None, e))
+			return
+		self.queue.put((_DONE, None))
+
+
+class Sink:
+	"""
+	Class that hands items to a function on a background thread. Items are
+	queued up to maxsize, so add only waits when the thread falls that far
+	behind. The first error of the function is raised by the next add or by
+	close, and the items after it are dropped.
+	"""
+	def __init__(self, function, maxsize=4):
+		"""
+		:param function: function called with every item
+		:param maxsize: number of items queued before add blocks, int
+		"""
+		self.function = function
+		self.queue = Queue(maxsize=maxsize)
+		self.error = None
+		self.thread = Thread(target=self._work, daemon=True)
+		self.thread.start()
+
+	def add(self, item):
+		if self.error is not None:
+			raise self.error
+		self.queue.put(item)
+
+	def close(self):
+		"""
+		Function that waits until all the queued items are handled
+		"""
+		self.queue.put(_DONE)
+		self.thread.join()
+		if self.error is not None:
+			raise self.error
+
+	def _work(self):
+		while True:
+			item = self.queue.get()
+			if item is _DONE:
+				break
+			if self.error is not None:
+				continue
+			try:
+				self.function(item)
+			except Exception as e:
+				self.error = e
+
+
+_DONE = object()
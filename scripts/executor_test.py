@@ -0,0 +1,86 @@
+import time
+import unittest
+import sys
+sys.path.append('scripts/')
+from executor import ExecutorFactory, PoolExecutor, Prefetcher, Sink
+
+_offset = {}
+
+
+def _install(offset):
+	_offset['value'] = offset
+
+
+def _add(x):
+	return x + _offset['value']
+
+
+def _sleep(x):
+	time.sleep(0.2)
+	return x
+
+
+class ExecutorTest(unittest.TestCase):
+	"""
+	Tests for the executors and the stages around them
+	"""
+	def _tasks(self, taken, n=10):
+		for i in range(n):
+			taken.append(i)
+			yield -i
+
+	def test_serial_executor(self):
+		self.assertEqual(list(ExecutorFactory().produce(1).map(abs, range(-3, 0))), [3, 2, 1])
+
+	def test_pool_executor_bounded(self):
+		taken = []
+		results = PoolExecutor(2, maxtasks=3).map(abs, self._tasks(taken))
+		self.assertEqual(next(results), 0)
+		self.assertEqual(len(taken), 3)
+		self.assertEqual(list(results), list(range(1, 10)))
+
+	def test_initializer(self):
+		for workers in [1, 2]:
+			executor = ExecutorFactory().produce(workers, initializer=_install, initargs=(10,))
+			self.assertEqual(list(executor.map(_add, range(4))), [10, 11, 12, 13])
+
+	def test_pool_executor_cancel(self):
+		start = time.time()
+		for x in PoolExecutor(2, maxtasks=16).map(_sleep, range(16)):
+			break
+		# the queued tasks are cancelled, only the started ones are waited for
+		self.assertLess(time.time() - start, 1.2)
+
+	def test_prefetcher(self):
+		taken = []
+		tasks = Prefetcher(self._tasks(taken), maxsize=2)
+		self.assertEqual(next(tasks), 0)
+		self.assertLessEqual(len(taken), 4)
+		self.assertEqual(list(tasks), [-x for x in range(1, 10)])
+		self.assertEqual(list(tasks), [])
+
+	def test_prefetcher_error(self):
+		def tasks():
+			yield 1
+			raise ValueError('bad cell')
+		prefetcher = Prefetcher(tasks())
+		self.assertEqual(next(prefetcher), 1)
+		self.assertRaises(ValueError, next, prefetcher)
+
+	def test_sink(self):
+		items = []
+		sink = Sink(items.append, maxsize=2)
+		for i in range(10):
+			sink.add(i)
+		sink.close()
+		self.assertEqual(items, list(range(10)))
+
+	def test_sink_error(self):
+		sink = Sink(lambda x: 1 / x)
+		sink.add(0)
+		sink.add(1)
+		self.assertRaises(ZeroDivisionError, sink.close)
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
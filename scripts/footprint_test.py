@@ -28,6 +28,10 @@ class FootprintTest(unittest.TestCase):
 		print(p.is_valid)
 		self.assertEqual(Footprint(p).polygon.is_valid, True)
 
+	def test_trusted_polygon(self):
+		p = Polygon([(0, 0), (0, 2), (1, 1), (2, 2), (2, 0), (1, 1), (0, 0)])
+		self.assertIs(Footprint(p, valid=True).polygon, p)
+
 	def test_multipolygon(self):
 		p1 = Polygon([(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)])
 		p2 = Polygon([(1, 1), (1, 3), (3, 3), (3, 1), (1, 1)])
@@ -1,9 +1,12 @@
+import numpy as np
+import shapely
 from shapely.geometry import Polygon
 import geopandas as gpd
 import sys
 
 sys.path.append('scripts/')
-from polygon import Reader, Collection, Footprint, Uniter
+from polygon import Reader, Collection, Footprint, Uniter, ComponentUniter
+from utils import geometry_array
 
 
 class Grid:
@@ -19,22 +22,49 @@ class Grid:
 class CellCalculator:
 	def __init__(self, grid):
 		self.grid = grid
-		self.margin = 10000
-
-	def get(self, collection, cell):
-		return self._get(collection, cell)
-
-	def _get(self, dataframe, cell):
-		_collection = Collection(Footprint)
-		# _p1 = None
-		for polygon in dataframe:
-			if polygon.centroid.distance(self.grid.grid[cell]) < self.margin: #self.grid.width:
-				if polygon.centroid.distance(self.grid.grid[cell]) < self.margin: #self.grid.height:
-					if polygon.intersects(self.grid.grid[cell]) or polygon.within(self.grid.grid[cell]):
-						# _collection.add(Footprint(polygon))
-						# if _p1:
-						# _p1 = polygon
-						_collection = Uniter().make(_collection, Footprint(polygon))
-		return _collection, self.grid.grid[cell]
 
+	def assign(self, buildings):
+		"""
+		Function that finds the buildings of every grid cell in one indexed query
+		:param buildings: building footprints, list of Polygon
+		:return: sorted building ids for every cell, list of np.array
+		"""
+		if len(buildings) == 0:
+			return [np.zeros(0, dtype=np.int64) for _ in self.grid.grid]
+		tree = shapely.STRtree(geometry_array(buildings))
+		cells, ids = tree.query(geometry_array(self.grid.grid), predicate='intersects')
+		order = np.lexsort((ids, cells))
+		cells, ids = cells[order], ids[order]
+		return np.split(ids, np.searchsorted(cells, np.arange(1, len(self.grid.grid))))
+
+	def read(self, filename, cell, reader=None):
+		"""
+		Function that reads from disk only the buildings of one grid cell
+		:param filename: path to the buildings shapefile, str
+		:param cell: grid cell index, int
+		:param reader: reader to stream with, Reader
+		:return: feature ids and geometries of the buildings, tuple of lists
+		"""
+		if reader is None:
+			reader = Reader()
+		ids, buildings = reader.read_bbox(filename, self.grid.grid[cell].bounds)
+		if len(buildings) == 0:
+			return ids, buildings
+		inside = shapely.intersects(geometry_array(buildings), self.grid.grid[cell])
+		return [x for x, y in zip(ids, inside) if y], [x for x, y in zip(buildings, inside) if y]
 
+	def get(self, collection, cell, ids=None):
+		return self._get(collection, cell, ids)
+
+	def _get(self, dataframe, cell, ids=None):
+		"""
+		:param dataframe: building footprints, list of Polygon
+		:param cell: grid cell index, int
+		:param ids: building ids of the cell, as given by assign, np.array
+		:return: merged collection of the cell and the cell polygon, tuple
+		"""
+		if ids is None:
+			tree = shapely.STRtree(geometry_array(dataframe))
+			ids = np.sort(tree.query(self.grid.grid[cell], predicate='intersects'))
+		_collection = ComponentUniter().merge([dataframe[i] for i in ids])
+		return _collection, self.grid.grid[cell]
@@ -0,0 +1,119 @@
+import unittest
+import numpy as np
+from shapely.geometry import Polygon
+import sys
+sys.path.append('scripts/')
+from config import INCREMENTAL_TOLERANCE
+from pipeline import MainPipeline
+from polygon import Collection, Footprint, Iteration, Grower, PairwiseGrower, ComponentUniter, \
+	Simplifier, membership
+from synthetic import SyntheticCity
+from validation import DriftReport
+
+
+class GrowerTest(unittest.TestCase):
+	"""
+	Tests for the growth engines
+	"""
+	def _collection(self):
+		collection = Collection(Footprint)
+		collection.add(Footprint(Polygon([(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)])))
+		collection.add(Footprint(Polygon([(10, 0), (10, 1), (11, 1), (11, 0), (10, 0)])))
+		collection.add(Footprint(Polygon([(0, 3), (0, 4), (1, 4), (1, 3), (0, 3)])))
+		collection.add(Footprint(Polygon([(3, 0), (3, 1), (4, 1), (4, 0), (3, 0)])))
+		return collection
+
+	def test_grower_cluster_number(self):
+		collection = self._collection()
+		self.assertEqual(len(Grower().make(collection, 0.4)), 4)
+		self.assertEqual(len(Grower().make(collection, 0.9)), 4)
+		self.assertEqual(len(Grower().make(collection, 1)), 2)
+		self.assertEqual(len(Grower().make(collection, 5)), 1)
+
+	def test_grower_matches_pairwise(self):
+		collection = self._collection()
+		for value in [0.5, 1.5, 3, 5]:
+			new = Grower().make(collection, value)
+			reference = PairwiseGrower().make(collection, value)
+			self.assertEqual(len(new), len(reference))
+			for footprint, footprint1 in zip(new, reference):
+				self.assertAlmostEqual(footprint.polygon.symmetric_difference(
+					footprint1.polygon).area, 0)
+
+	def test_grower_empty(self):
+		self.assertEqual(len(Grower().make(Collection(Footprint), 1)), 0)
+
+	def test_iteration_default_grower(self):
+		collection = self._collection()
+		new = Iteration(collection, 1.5).make()
+		self.assertIsInstance(new, Collection)
+		self.assertEqual(len(new), 2)
+
+	def test_grower_labels(self):
+		collection = self._collection()
+		new = Grower().make(collection, 1)
+		self.assertEqual(list(new.labels), [1, 0, 1, 1])
+		self.assertEqual(list(Grower().make(new, 4).labels), [0, 0, 0, 0])
+
+	def test_membership(self):
+		collection = self._collection()
+		new = Grower().make(collection, 1)
+		labels = membership(new, collection)
+		for footprint, label in zip(collection, labels):
+			self.assertTrue(footprint.polygon.within(new.collection[label].polygon))
+
+	def test_simplifier(self):
+		collection = Collection(Footprint)
+		collection.add(Footprint(Polygon([(0, 0), (0, 1), (0.5, 1.001), (1, 1), (1, 0), (0, 0)])))
+		collection.labels = np.array([0, 0])
+		for preserve_topology in [True, False]:
+			new = Simplifier().make(collection, 0.01, preserve_topology=preserve_topology)
+			self.assertEqual(len(new.collection[0].polygon.exterior.coords), 5)
+			self.assertTrue(new.collection[0].polygon.is_valid)
+			self.assertEqual(list(new.labels), [0, 0])
+
+	def test_simplifier_split(self):
+		# Douglas-Peucker splits this footprint in two at a tolerance of 2
+		polygon = Polygon([(-3, 1), (-9, -3), (-1, -1), (-3, -4), (4, -7), (1, -1)])
+		collection = Collection(Footprint)
+		collection.add(Footprint(polygon))
+		new = Simplifier().make(collection, 2, preserve_topology=False)
+		self.assertEqual(new.collection[0].polygon.geom_type, 'Polygon')
+		self.assertTrue(new.collection[0].polygon.is_valid)
+		self.assertLessEqual(new.collection[0].polygon.hausdorff_distance(polygon), 2)
+
+	def test_incremental_growth(self):
+		collection = ComponentUniter().merge(SyntheticCity(200, vertices=8, seed=3).make())
+		exact_pipe = MainPipeline('exact', export_csv=False)
+		incremental_pipe = MainPipeline('incremental', incremental=True, export_csv=False)
+		previous = collection
+		for value in range(1, 6):
+			exact = exact_pipe._grow(None, None, collection, previous, value)
+			previous = incremental_pipe._grow(None, None, collection, previous, value)
+			self.assertEqual(membership(previous, collection).tolist(),
+			                 membership(exact, collection).tolist())
+			for measure in ['area', 'length']:
+				value = sum(getattr(x.polygon, measure) for x in exact)
+				drift = sum(getattr(x.polygon, measure) for x in previous) - value
+				self.assertLess(abs(drift) / value, 1e-3)
+			self.assertTrue(all(x.polygon.is_valid for x in previous))
+
+	def test_incremental_drift(self):
+		report = DriftReport('test_shapefiles/test.shp').make()
+		self.assertTrue((report.exact_clusters == report.incremental_clusters).all())
+		self.assertLess(report.area_relative_drift.abs().max(), 1e-3)
+		self.assertLess(report.perimeter_relative_drift.abs().max(), 1e-3)
+
+	def test_grower_settings(self):
+		collection = Collection(Footprint)
+		collection.add(Footprint(Polygon([(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)])))
+		new = Grower(join_style='mitre').make(collection, 1)
+		self.assertAlmostEqual(new.collection[0].polygon.area, 9)
+		new = Grower(quad_segs=2, grid_size=0.5).make(collection, 1)
+		for x, y in new.collection[0].polygon.exterior.coords:
+			self.assertEqual(x * 2, round(x * 2))
+			self.assertEqual(y * 2, round(y * 2))
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -0,0 +1,88 @@
+import json
+import os
+import tempfile
+import unittest
+import sys
+sys.path.append('scripts/')
+from pipeline import MergePipeline
+from writer import ColumnarWriter, Manifest, process_filename, read_results, shard_filename
+
+
+class MergeTest(unittest.TestCase):
+	"""
+	Tests for merging the outputs of the shards of a grid run
+	"""
+	def setUp(self):
+		self.folder = tempfile.TemporaryDirectory()
+		self.output = os.path.join(self.folder.name, 'grid.ndjson')
+
+	def tearDown(self):
+		self.folder.cleanup()
+
+	def _shard(self, number, cells, empty=(), total=5, shards=2):
+		filename = shard_filename(self.output, (number, shards))
+		writer = ColumnarWriter(filename, ['a'])
+		process_writer = ColumnarWriter(process_filename(filename), ['b'], keys=['cell'])
+		manifest = Manifest(filename + '.manifest.json',
+		                    run={'buildings': 'a.shp', 'grid': 'grid.shp',
+		                         'shard': [number, shards]})
+		for cell in cells:
+			for i in range(3):
+				writer.add((cell, i), {'a': cell * 10 + i})
+			process_writer.add((cell,), {'b': cell})
+			writer.flush()
+			process_writer.flush()
+			manifest.add(cell, ['result/{}.csv'.format(cell)],
+			             [writer.filename, process_writer.filename])
+		manifest.skip(empty, total)
+		manifest.save()
+		return filename
+
+	def test_merge(self):
+		self._shard(2, [1, 3])
+		self._shard(1, [0, 4], empty=[2])
+		self.assertEqual(MergePipeline(self.output).run(), [0, 1, 3, 4])
+		df = read_results(self.output)
+		self.assertEqual(df['cell'].tolist(), [0] * 3 + [1] * 3 + [3] * 3 + [4] * 3)
+		self.assertEqual(df['iter'].tolist(), [0, 1, 2] * 4)
+		self.assertEqual(read_results(process_filename(self.output))['b'].tolist(), [0, 1, 3, 4])
+		with open(self.output + '.manifest.json') as f:
+			manifest = json.load(f)
+		self.assertEqual(manifest['run'], {'buildings': 'a.shp', 'grid': 'grid.shp'})
+		self.assertEqual(manifest['empty'], [2])
+		self.assertEqual(manifest['cells']['3'], ['result/3.csv'])
+
+	def test_missing_shard(self):
+		self._shard(1, [0, 4], empty=[2])
+		with self.assertRaises(ValueError):
+			MergePipeline(self.output).run()
+		self.assertFalse(os.path.exists(self.output))
+
+	def test_missing_cell(self):
+		self._shard(1, [0, 4], empty=[2])
+		self._shard(2, [1])
+		with self.assertRaises(ValueError):
+			MergePipeline(self.output).run()
+
+	def test_empty_shard(self):
+		self._shard(1, [0, 4], empty=[2])
+		self._shard(2, [], empty=[1, 3])
+		self.assertFalse(os.path.exists(shard_filename(self.output, (2, 2))))
+		self.assertEqual(MergePipeline(self.output).run(), [0, 4])
+		with open(self.output + '.manifest.json') as f:
+			self.assertEqual(json.load(f)['empty'], [1, 2, 3])
+
+	def test_empty_shard_given(self):
+		first = self._shard(1, [0, 4], empty=[2])
+		second = self._shard(2, [], empty=[1, 3])
+		self.assertEqual(MergePipeline(self.output).run([first, second]), [0, 4])
+
+	def test_duplicate_shard(self):
+		first = self._shard(1, [0, 2, 4])
+		second = self._shard(2, [1, 3])
+		with self.assertRaises(ValueError):
+			MergePipeline(self.output).run([first, first, second])
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
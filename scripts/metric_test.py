@@ -98,6 +98,132 @@ class MetricTest(unittest.TestCase):
 		result = DistanceMatrixMetric().calculate(collection)
 		self.assertEqual(list(result.values())[0][0][0], 0)
 
+	def test_dlimit_metric(self):
+		p1 = Polygon([(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)])
+		p2 = Polygon([(0, 2), (2, 2), (2, 4), (0, 4), (0, 2)])
+		p3 = Polygon([(10, 2), (12, 2), (12, 4), (10, 4), (10, 2)])
+		collection = Collection(Footprint)
+		collection.add(Footprint(p1))
+		collection.add(Footprint(p2))
+		collection.add(Footprint(p3))
+		self.assertEqual(DlimitMetric().calculate(collection), 4)
+
+	def test_clusters_at_distance_metric(self):
+		p1 = Polygon([(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)])
+		p2 = Polygon([(6, 0), (6, 1), (7, 1), (7, 0), (6, 0)])
+		p3 = Polygon([(0, 6), (0, 7), (1, 7), (1, 6), (0, 6)])
+		collection = Collection(Footprint)
+		collection.add(Footprint(p1))
+		collection.add(Footprint(p2))
+		collection.add(Footprint(p3))
+		self.assertEqual(ClustersAtDistanceMetric().calculate(collection), 2)
+
+	def test_shared_pairwise_distances(self):
+		p1 = Polygon([(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)])
+		p2 = Polygon([(0, 2), (2, 2), (2, 4), (0, 4), (0, 2)])
+		collection = Collection(Footprint)
+		collection.add(Footprint(p1))
+		collection.add(Footprint(p2))
+		distances = PairwiseDistances(collection)
+		self.assertIs(pairwise_distances(collection, {'distances': distances}), distances)
+		self.assertEqual(MinimumClusterDistanceMetric().calculate(
+			collection, distances=distances), 1)
+		self.assertEqual(list(distances.nearest()), [1, 1])
+
+	def test_centroid_distances(self):
+		collection = Collection(Footprint)
+		for x in [0, 3, 7]:
+			collection.add(Footprint(Polygon([(x, 0), (x, 2), (x + 2, 2), (x + 2, 0), (x, 0)])))
+		distances = CentroidDistances(collection, block=2)
+		self.assertEqual(distances.condensed().tolist(), [3, 7, 4])
+		self.assertEqual(distances.matrix()[0].tolist(), [0, 3, 7])
+		self.assertEqual(distances.sum(), 14)
+		self.assertEqual(DistanceMatrixMediaMetric().calculate(
+			collection, centroids=distances), 14 / 9)
+
+	def test_centroid_distances_tiles(self):
+		collection = Collection(Footprint)
+		for x, y in np.random.default_rng(0).uniform(0, 100, (11, 2)):
+			collection.add(Footprint(Polygon([(x, y), (x, y + 1), (x + 1, y + 1), (x + 1, y)])))
+		whole = CentroidDistances(collection, block=16)
+		for block in [1, 3, 4]:
+			tiled = CentroidDistances(collection, block=block)
+			self.assertTrue(np.allclose(tiled.matrix(), whole.matrix()))
+			self.assertEqual(tiled.condensed().tolist(), whole.condensed().tolist())
+			self.assertAlmostEqual(tiled.sum(), whole.sum())
+		self.assertTrue(np.allclose(whole.matrix()[np.triu_indices(11, k=1)], whole.condensed()))
+
+	def test_clipped_areas(self):
+		p1 = Polygon([(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)])
+		p2 = Polygon([(3, 0), (3, 2), (5, 2), (5, 0), (3, 0)])
+		hull = Polygon([(1, 0), (1, 2), (4, 2), (4, 0), (1, 0)])
+		collection = Collection(Footprint)
+		collection.add(Footprint(p1))
+		collection.add(Footprint(p2))
+		cell = Polygon([(0, 0), (0, 1), (5, 1), (5, 0), (0, 0)])
+		clipped = ClippedAreas(collection, [hull, cell])
+		self.assertEqual(clipped.areas(hull).tolist(), [2, 2])
+		self.assertIsNone(clipped._areas[1])
+		self.assertEqual(clipped.areas(cell).tolist(), [2, 2])
+		self.assertEqual(TotalAreaMetric().calculate(collection, hull=hull, clipped=clipped), 4)
+		self.assertEqual(AreaRatioMetric().calculate(collection, hull=hull, clipped=clipped), 4 / 6)
+
+	def test_intermediates(self):
+		p1 = Polygon([(0, 0), (0, 2), (2, 2), (2, 0), (0, 0)])
+		p2 = Polygon([(3, 0), (3, 2), (5, 2), (5, 0), (3, 0)])
+		collection = Collection(Footprint)
+		collection.add(Footprint(p1))
+		collection.add(Footprint(p2))
+		hull = Polygon([(0, 0), (0, 2), (5, 2), (5, 0), (0, 0)])
+		intermediates = Intermediates(collection, [hull], collection)
+		self.assertEqual(intermediates.products, {})
+		self.assertEqual(DlimitMetric().calculate(collection, intermediates=intermediates), 0.5)
+		self.assertEqual(MinimumClusterDistanceMetric().calculate(
+			collection, intermediates=intermediates), 1)
+		self.assertEqual(list(intermediates.products), ['distances'])
+		self.assertEqual(TotalAreaMetric().calculate(
+			collection, hull=hull, intermediates=intermediates), 8)
+		self.assertEqual(sorted(intermediates.products), ['clipped', 'distances'])
+
+	def test_select_metrics(self):
+		self.assertEqual(select_metrics()[0], 'cluster_number')
+		self.assertEqual(select_metrics(['hindex', 'Dlimit']), ['cluster_number', 'hindex', 'Dlimit'])
+		self.assertEqual(select_metrics(['all'], skip_heavy=True),
+		                 ['cluster_number', 'total_perimeter', 'hindex'])
+		with self.assertRaises(AssertionError):
+			select_metrics(['unknown'])
+
+	def _process_values(self):
+		clusters = [10, 6, 6, 3, 1]
+		return {i: {'cluster_number': x, 'total_area': 10.5 * (i + 1)}
+		        for i, x in enumerate(clusters)}
+
+	def test_process_metrics(self):
+		values = self._process_values()
+		expected = {'xy': 3, 'total_sum': 26, 'total_nr_sum': 20, 'max_variation': 4,
+		            'iter_max_variation': 0, 'clusters_reduction_distance': [3, 4]}
+		for name, value in expected.items():
+			result = ProcessMetricFactory().produce(name).calculate(values, field='cluster_number')
+			self.assertEqual(result, value, name)
+			self.assertIsInstance(result, type(value))
+		self.assertEqual(TotalClusterSumMetric().calculate(values, field='total_area'), 156)
+
+	def test_process_metrics_stacked(self):
+		runs = [self._process_values(), {0: {'cluster_number': 4, 'total_area': 2.},
+		                                 1: {'cluster_number': 1, 'total_area': 3.}}]
+		values, iterations, lengths = process_array(runs, ['cluster_number', 'total_area'])
+		self.assertEqual(values.shape, (2, 5, 2))
+		self.assertEqual(lengths.tolist(), [5, 2])
+		for name in ProcessMetricFactory().dict:
+			metric = ProcessMetricFactory().produce(name)
+			array = metric.calculate_array(values, iterations, lengths)
+			self.assertEqual(array.shape, (2, 2))
+			for i, run in enumerate(runs):
+				for j, field in enumerate(['cluster_number', 'total_area']):
+					value = array[i, j]
+					value = value.item() if isinstance(value, np.generic) else value
+					self.assertEqual(value, metric.calculate(run, field=field), name)
+
 
 if __name__ == '__main__':
 	unittest.main(verbosity=2)
@@ -1,10 +1,12 @@
 import numpy as np
+import shapely
 from shapely.geometry import MultiPolygon
 import sys
 from time import time
 
 sys.path.append('scripts/')
-from polygon import Collection, Footprint
+from config import DISTANCE_MATRIX_CONDENSED, METRICS
+from polygon import Collection, Footprint, polygon_array, membership
 
 
 class MetricFactory:
@@ -29,6 +31,32 @@ class MetricFactory:
 		return self.dict[metric]()
 
 
+def select_metrics(names=None, skip_heavy=False):
+	"""
+	Function that resolves the metrics of a run. cluster_number always comes
+	first, as the iterations stop on it.
+	:param names: metric names, or 'all' for every metric and 'default' for
+	config.METRICS, list of str; config.METRICS by default
+	:param skip_heavy: drop the metrics that need a geometry-heavy product,
+	see Intermediates.HEAVY, bool
+	:return: metric names, list of str
+	"""
+	factory = MetricFactory()
+	selected = []
+	for name in (['default'] if names is None else names):
+		if name == 'all':
+			selected += list(factory.dict.keys())
+		elif name == 'default':
+			selected += METRICS
+		else:
+			assert name in factory.dict, "Unknown metric {}".format(name)
+			selected.append(name)
+	if skip_heavy:
+		selected = [x for x in selected if not
+		            set(factory.dict[x].REQUIRES) & set(Intermediates.HEAVY)]
+	return ['cluster_number'] + [x for x in dict.fromkeys(selected) if x != 'cluster_number']
+
+
 class ProcessMetricFactory:
 	"""
 	A factory that generates metrics that are calculated over all the iterations.
@@ -47,7 +75,273 @@ class ProcessMetricFactory:
 		return self.dict[metric]()
 
 
+class PairwiseDistances:
+	"""
+	Edge-to-edge distances between the clusters of a collection, shared by all
+	the distance metrics of an iteration. Everything is computed lazily with
+	vectorized calls on an STRtree and kept for the next metric.
+	"""
+	def __init__(self, collection):
+		"""
+		:param collection: collection of Footprints, Collection
+		"""
+		self.collection = collection
+		self.polygons = polygon_array(collection)
+		self.n = len(self.polygons)
+		self._tree = None
+		self._nearest = None
+		self._radius = None
+		self._pairs = None
+
+	@property
+	def tree(self):
+		if self._tree is None:
+			self._tree = shapely.STRtree(self.polygons)
+		return self._tree
+
+	def nearest(self):
+		"""
+		Function that finds the distance from every cluster to the closest other one
+		:return: distances, np.array of float
+		"""
+		if self._nearest is None:
+			self._nearest = np.full(self.n, np.inf)
+			if self.n > 1:
+				(left, _), distance = self.tree.query_nearest(self.polygons, exclusive=True,
+				                                               return_distance=True,
+				                                               all_matches=False)
+				np.minimum.at(self._nearest, left, distance)
+		return self._nearest
+
+	def within(self, radius):
+		"""
+		Function that finds the distances of all the pairs of clusters closer
+		than a radius. Every pair is counted once.
+		:param radius: search radius, float
+		:return: distances, np.array of float
+		"""
+		if self._radius is None or radius > self._radius:
+			left, right = self.tree.query(self.polygons, predicate='dwithin', distance=radius)
+			left, right = left[left < right], right[left < right]
+			self._pairs = shapely.distance(self.polygons[left], self.polygons[right])
+			self._radius = radius
+		return self._pairs[self._pairs <= radius]
+
+
+def pairwise_distances(collection, args):
+	"""
+	Function that returns the shared distances of a collection, or computes them
+	if the metric is called on its own
+	:return: distances, PairwiseDistances
+	"""
+	return shared(collection, args, 'distances', PairwiseDistances)
+
+
+class CentroidDistances:
+	"""
+	Distances between the centroids of the clusters of a collection, shared by
+	the distance matrix metrics. The centroids are extracted once and the
+	distances are computed by broadcasting, one block x block tile of the
+	upper triangle at a time. The sum and the mean therefore work in
+	O(block ** 2) memory whatever the number of clusters; the matrix and the
+	condensed distances hold their own n x n and n * (n - 1) / 2 results.
+	"""
+	def __init__(self, collection, block=1024):
+		"""
+		:param collection: collection of Footprints, Collection
+		:param block: number of rows and columns of the tiles computed at once, int
+		"""
+		self.collection = collection
+		self.n = len(collection)
+		self.block = block
+		self._centroids = None
+		self._sum = None
+
+	@property
+	def centroids(self):
+		if self._centroids is None:
+			self._centroids = shapely.get_coordinates(
+				shapely.centroid(polygon_array(self.collection)))
+		return self._centroids
+
+	def _blocks(self):
+		"""
+		Function that yields the tiles of the matrix that hold the upper
+		triangle, row of tiles by row of tiles
+		:return: first row and first column of the tile, its distances and the
+		mask of its entries above the diagonal, generator of (int, int,
+		np.array, np.array)
+		"""
+		for row in range(0, self.n, self.block):
+			rows = self.centroids[row:row + self.block]
+			for column in range(row, self.n, self.block):
+				columns = self.centroids[column:column + self.block]
+				distances = np.sqrt(np.sum((rows[:, None, :] - columns[None, :, :]) ** 2, axis=-1))
+				upper = np.arange(column, column + len(columns))[None, :] > \
+					np.arange(row, row + len(rows))[:, None]
+				yield row, column, distances, upper
+
+	def matrix(self):
+		"""
+		:return: distances above the diagonal, zeros elsewhere, np.array n x n
+		"""
+		matrix = np.zeros((self.n, self.n))
+		for row, column, distances, upper in self._blocks():
+			matrix[row:row + len(distances), column:column + distances.shape[1]] = \
+				np.where(upper, distances, 0)
+		return matrix
+
+	def condensed(self, dtype=np.float32):
+		"""
+		:return: distances above the diagonal row by row, np.array n * (n - 1) / 2
+		"""
+		result = np.zeros(self.n * (self.n - 1) // 2, dtype=dtype)
+		for row, column, distances, upper in self._blocks():
+			i, j = np.nonzero(upper)
+			i, j = i + row, j + column
+			result[i * self.n - i * (i + 1) // 2 + j - i - 1] = distances[upper]
+		return result
+
+	def sum(self):
+		if self._sum is None:
+			self._sum = 0.
+			for _, _, distances, upper in self._blocks():
+				self._sum += np.sum(distances[upper])
+		return self._sum
+
+	def mean(self):
+		"""
+		:return: mean of the whole n x n matrix, zeros included, float
+		"""
+		if self.n == 0:
+			return np.nan
+		return self.sum() / self.n ** 2
+
+
+def centroid_distances(collection, args):
+	"""
+	Function that returns the shared centroid distances of a collection, or
+	computes them if the metric is called on its own
+	:return: distances, CentroidDistances
+	"""
+	return shared(collection, args, 'centroids', CentroidDistances)
+
+
+class ClippedAreas:
+	"""
+	Areas of the clusters of a collection clipped by the hull and by the sample
+	cell, shared by the area metrics. The clusters are clipped against a mask
+	in one vectorized call, the first time an area by that mask is asked for,
+	so a mask no selected metric reads is never clipped against.
+	"""
+	def __init__(self, collection, masks=()):
+		"""
+		:param collection: collection of Footprints, Collection
+		:param masks: geometries the clusters may be clipped by, list of Polygon
+		"""
+		self.collection = collection
+		self.masks = [x for x in masks if x is not None]
+		self._areas = [None] * len(self.masks)
+
+	def areas(self, mask):
+		"""
+		:param mask: geometry to clip by, Polygon
+		:return: clipped area of every cluster, np.array of float
+		"""
+		columns = [i for i, x in enumerate(self.masks) if x is mask]
+		if not columns:
+			self.masks.append(mask)
+			self._areas.append(None)
+			columns = [len(self.masks) - 1]
+		if self._areas[columns[0]] is None:
+			self._areas[columns[0]] = shapely.area(shapely.intersection(
+				polygon_array(self.collection), mask))
+		return self._areas[columns[0]]
+
+
+def clipped_areas(collection, args):
+	"""
+	Function that returns the shared clipped areas of a collection, or
+	computes them if the metric is called on its own
+	:return: clipped areas, ClippedAreas
+	"""
+	return shared(collection, args, 'clipped', ClippedAreas)
+
+
+class Intermediates:
+	"""
+	Intermediate products of a collection shared by its metrics: the
+	pairwise distances, the centroid distances, the areas clipped by the
+	hull and the cell and the membership of the initial footprints. A
+	product is built the first time a metric asks for it, so an iteration
+	only pays for the products its metrics need, and only once.
+	"""
+	HEAVY = ['distances', 'centroids', 'clipped']
+
+	def __init__(self, collection, masks=(), initial_collection=None):
+		"""
+		:param collection: collection of Footprints, Collection
+		:param masks: geometries the areas are clipped by, list of Polygon
+		:param initial_collection: collection the iterations grow from, Collection
+		"""
+		self.collection = collection
+		self.masks = list(masks)
+		self.initial_collection = initial_collection
+		self.products = {}
+
+	def get(self, name):
+		if name not in self.products:
+			self.products[name] = self._make(name)
+		return self.products[name]
+
+	def _make(self, name):
+		if name == 'distances':
+			return PairwiseDistances(self.collection)
+		if name == 'centroids':
+			return CentroidDistances(self.collection)
+		if name == 'clipped':
+			return ClippedAreas(self.collection, self.masks)
+		if name == 'membership':
+			return membership(self.collection, self.initial_collection)
+		print('Unknown intermediate product {}'.format(name))
+		raise KeyError
+
+
+def shared(collection, args, name, default):
+	"""
+	Function that returns a shared product of a collection, or computes it
+	if the metric is called on its own
+	:param name: name of the product, str
+	:param default: function that builds the product from the collection
+	"""
+	if 'intermediates' in args and args['intermediates'].collection is collection:
+		return args['intermediates'].get(name)
+	if name in args and args[name].collection is collection:
+		return args[name]
+	return default(collection)
+
+
+def h_index(sizes):
+	"""
+	Function that calculates the hindex of the cluster sizes: the largest size
+	that is not above the number of clusters bigger than it
+	:param sizes: number of footprints in each cluster, list or np.array
+	:return: hindex, int
+	"""
+	values = np.array(np.unique(np.array(sizes), return_counts=True))[:, ::-1]
+	for v in values[0]:
+		if v <= np.sum(values[1][:list(values[0]).index(v)]):
+			return v
+	return 1
+
+
 class Metric:
+	"""
+	Metric of one collection. REQUIRES lists the intermediate products it
+	reads from the shared Intermediates of the collection.
+	"""
+	REQUIRES = []
+
 	def __init__(self, name: str='generic'):
 		if not isinstance(name, str):
 			raise TypeError
@@ -71,6 +365,8 @@ class ClusterNumberMetric(Metric):
 
 
 class DlimitMetric(Metric):
+	REQUIRES = ['distances']
+
 	def __init__(self, name: str='Dlimit'):
 		Metric.__init__(self, name)
 
@@ -80,18 +376,14 @@ class DlimitMetric(Metric):
 			raise TypeError
 		if not isinstance(collection.class_type, Footprint.__class__):
 			raise AttributeError
-		min_dist = 0
-		for i, element in enumerate(collection.collection):
-			max_dist = 10000000  # distance between the closest footprints
-			for j, element1 in enumerate(collection.collection):
-				if j != i:
-					max_dist = min(max_dist, element.polygon.distance(element1.polygon))
-			if len(collection) > 1:
-				min_dist = max(min_dist, max_dist)
-		return min_dist / 2
+		if len(collection) < 2:
+			return 0
+		return np.max(pairwise_distances(collection, args).nearest()) / 2
 
 
 class MinimumClusterDistanceMetric(Metric):
+	REQUIRES = ['distances']
+
 	def __init__(self, name: str='minimum_cluster_distance'):
 		Metric.__init__(self, name)
 
@@ -102,29 +394,21 @@ class MinimumClusterDistanceMetric(Metric):
 		if not isinstance(collection.class_type, Footprint.__class__):
 			raise AttributeError
 
-		min_dist = 10000000
-		for i, element in enumerate(collection.collection):
-			for j, element1 in enumerate(collection.collection):
-				if j > i:
-					min_dist = min(min_dist, element.polygon.distance(
-						element1.polygon))
-		if min_dist == 10000000:
-			min_dist = 0
-		return min_dist
+		if len(collection) < 2:
+			return 0
+		return np.min(pairwise_distances(collection, args).nearest())
 
 
 class TotalAreaMetric(Metric):
+	REQUIRES = ['clipped']
+
 	def __init__(self, name: str='total_area'):
 		Metric.__init__(self, name)
 
 	def _calculate(self, collection: Collection, **args):
 		if not isinstance(collection.class_type, Footprint.__class__):
 			raise AttributeError
-		hull = args['hull']
-		area = 0
-		for footprint in collection:
-			area += footprint.polygon.intersection(hull).area
-		return area
+		return np.sum(clipped_areas(collection, args).areas(args['hull']))
 
 
 class TotalPerimeterMetric(Metric):
@@ -141,54 +425,47 @@ class TotalPerimeterMetric(Metric):
 
 
 class DistanceMatrixMetric(Metric):
+	REQUIRES = ['centroids']
+
 	def __init__(self, name: str='distance_matrix'):
 		Metric.__init__(self, name)
+		self.condensed = DISTANCE_MATRIX_CONDENSED
 
 	def _calculate(self, collection: Collection, **args):
 		if not isinstance(collection.class_type, Footprint.__class__):
 			raise AttributeError
-		distance_matrix = np.zeros((len(collection), len(collection)))
-		for i, footprint in enumerate(collection.collection):
-			for j, footprint1 in enumerate(collection.collection):
-				if j > i:
-					distance_matrix[i][j] = footprint.polygon.centroid.distance(footprint1.polygon.centroid)
-
-		return distance_matrix.tolist()
+		if self.condensed:
+			return centroid_distances(collection, args).condensed()
+		return centroid_distances(collection, args).matrix()
 
 
 class DistanceMatrixSumMetric(Metric):
+	REQUIRES = ['centroids']
+
 	def __init__(self, name: str='distance_matrix_sum'):
 		Metric.__init__(self, name)
 
 	def _calculate(self, collection: Collection, **args):
 		if not isinstance(collection.class_type, Footprint.__class__):
 			raise AttributeError
-		distance_matrix = np.zeros((len(collection), len(collection)))
-		for i, footprint in enumerate(collection.collection):
-			for j, footprint1 in enumerate(collection.collection):
-				if j > i:
-					distance_matrix[i][j] = footprint.polygon.centroid.distance(footprint1.polygon.centroid)
-
-		return np.sum(distance_matrix)
+		return centroid_distances(collection, args).sum()
 
 
 class DistanceMatrixMediaMetric(Metric):
+	REQUIRES = ['centroids']
+
 	def __init__(self, name: str='distance_matrix_mean'):
 		Metric.__init__(self, name)
 
 	def _calculate(self, collection: Collection, **args):
 		if not isinstance(collection.class_type, Footprint.__class__):
 			raise AttributeError
-		distance_matrix = np.zeros((len(collection), len(collection)))
-		for i, footprint in enumerate(collection.collection):
-			for j, footprint1 in enumerate(collection.collection):
-				if j > i:
-					distance_matrix[i][j] = footprint.polygon.centroid.distance(footprint1.polygon.centroid)
-
-		return np.mean(distance_matrix)
+		return centroid_distances(collection, args).mean()
 
 
 class HindexMetric(Metric):
+	REQUIRES = ['membership']
+
 	def __init__(self, name: str='hindex'):
 		Metric.__init__(self, name)
 
@@ -196,6 +473,13 @@ class HindexMetric(Metric):
 		if not isinstance(collection.class_type, Footprint.__class__):
 			raise AttributeError
 		initial_collection = args['initial_collection']
+		if 'intermediates' in args and args['intermediates'].collection is collection and \
+				args['intermediates'].initial_collection is initial_collection:
+			labels = args['intermediates'].get('membership')
+		else:
+			labels = membership(collection, initial_collection)
+		if labels is not None:
+			return h_index(np.bincount(labels, minlength=len(collection)))
 		result = {}
 		for i, footprint in enumerate(collection.collection):
 			result[i] = 0
@@ -205,50 +489,41 @@ class HindexMetric(Metric):
 					result[i] += 1
 
 		# result = {cluster1: n elements, cluster2: n elements}
-		values = np.array(list(result.values()))
-		values = np.array(np.unique(values, return_counts=True))[:, ::-1]
-		for v in values[0]:
-			if v <= np.sum(values[1][:list(values[0]).index(v)]):
-				return v
-		return 1
+		return h_index(list(result.values()))
 
 
 class AreaRatioMetric(Metric):
+	REQUIRES = ['clipped']
+
 	def __init__(self, name: str='area_ratio'):
 		Metric.__init__(self, name)
 
 	def _calculate(self, collection: Collection, **args):
 		if not isinstance(collection.class_type, Footprint.__class__):
 			raise AttributeError
-		result = {}
-		# _hull = MultiPolygon([x.polygon for x in collection]).convex_hull
 		hull = args['hull']
-
-		for i, footprint in enumerate(collection.collection):
-			result[i] = footprint.polygon.intersection(hull).area / hull.area
-		return np.sum(list(result.values()))
+		return np.sum(clipped_areas(collection, args).areas(hull) / hull.area)
 
 
 class AreaRatioCellMetric(Metric):
+	REQUIRES = ['clipped']
+
 	def __init__(self, name: str='area_ratio_cell'):
 		Metric.__init__(self, name)
 
 	def _calculate(self, collection: Collection, **args):
 		if not isinstance(collection.class_type, Footprint.__class__):
 			raise AttributeError
-		result = {}
-		# _hull = MultiPolygon([x.polygon for x in collection]).convex_hull
 		if 'sample' in list(args.keys()):
 			hull = args['sample']
 		else:
 			hull = args['hull']
-
-		for i, footprint in enumerate(collection.collection):
-			result[i] = footprint.polygon.intersection(hull).area / hull.area
-		return np.sum(list(result.values()))
+		return np.sum(clipped_areas(collection, args).areas(hull) / hull.area)
 
 
 class ClustersAtDistanceMetric(Metric):
+	REQUIRES = ['distances']
+
 	def __init__(self, name: str='clusters_at_distance'):
 		Metric.__init__(self, name)
 		self.distance = 5
@@ -256,16 +531,13 @@ class ClustersAtDistanceMetric(Metric):
 	def _calculate(self, collection: Collection, **args):
 		if not isinstance(collection.class_type, Footprint.__class__):
 			raise AttributeError
-		result = 0
-		for i, footprint in enumerate(collection.collection):
-			for j, footprint1 in enumerate(collection.collection):
-				if j > i:
-					if round(footprint.polygon.distance(footprint1.polygon)) == self.distance:
-						result += 1
-		return result
+		distances = pairwise_distances(collection, args).within(self.distance + 0.5)
+		return int(np.sum(np.round(distances) == self.distance))
 
 
 class ClustersAtPercentDistanceMetric(Metric):
+	REQUIRES = ['distances', 'initial_dlimit']
+
 	def __init__(self, name: str='clusters_at_percent_distance'):
 		Metric.__init__(self, name)
 		self.percent = 0.25
@@ -273,139 +545,185 @@ class ClustersAtPercentDistanceMetric(Metric):
 	def _calculate(self, collection: Collection, **args):
 		if not isinstance(collection.class_type, Footprint.__class__):
 			raise AttributeError
-		result = 0
-		distance = DlimitMetric().calculate(args['initial_collection'])
-		for i, footprint in enumerate(collection.collection):
-			for j, footprint1 in enumerate(collection.collection):
-				if j > i:
-					if round(footprint.polygon.distance(footprint1.polygon)) == self.percent * distance:
-						result += 1
-		return result
+		if 'initial_dlimit' in args:
+			distance = args['initial_dlimit']
+		else:
+			distance = DlimitMetric().calculate(args['initial_collection'])
+		target = self.percent * distance
+		distances = pairwise_distances(collection, args).within(target + 0.5)
+		return int(np.sum(np.round(distances) == target))
+
+
+def process_array(results, fields):
+	"""
+	Function that stacks the per-iteration results of one or more runs for
+	the process metrics. Runs with fewer iterations are padded with nan.
+	:param results: metric values of every iteration of every run, in
+	iteration order, list of dict {iteration: {field: value}}
+	:param fields: numeric fields to take, list of str
+	:return: values, np.array of float of runs x iterations x fields, iteration
+	numbers, np.array of int of runs x iterations, and number of iterations of
+	every run, np.array of int, tuple
+	"""
+	lengths = np.array([len(x) for x in results], dtype=np.int64)
+	size = int(lengths.max()) if len(lengths) else 0
+	values = np.full((len(results), size, len(fields)), np.nan)
+	iterations = np.tile(np.arange(size, dtype=np.int64), (len(results), 1))
+	for i, result in enumerate(results):
+		iterations[i, :lengths[i]] = [int(x) for x in result]
+		values[i, :lengths[i]] = [[float(x[field]) for field in fields] for x in result.values()]
+	return values, iterations, lengths
+
+
+def stack_results(df, fields, key='cell'):
+	"""
+	Function that stacks the rows of a grid run, as read_results gives them,
+	for the process metrics. Row t of every cell holds its t-th iteration.
+	:param df: one row per cell and iteration, pd.DataFrame
+	:param fields: numeric fields to take, list of str
+	:param key: column of the cells, str
+	:return: cells, np.array, and the process_array arrays of the cells, tuple
+	"""
+	df = df.sort_values([key, 'iter'], kind='stable')
+	cells, starts, lengths = np.unique(df[key].to_numpy(), return_index=True, return_counts=True)
+	size = int(lengths.max()) if len(lengths) else 0
+	rows = np.repeat(np.arange(len(cells)), lengths)
+	columns = np.arange(len(df)) - np.repeat(starts, lengths)
+	values = np.full((len(cells), size, len(fields)), np.nan)
+	values[rows, columns] = df[fields].to_numpy(dtype=np.float64)
+	iterations = np.tile(np.arange(size, dtype=np.int64), (len(cells), 1))
+	iterations[rows, columns] = df['iter'].to_numpy(dtype=np.int64)
+	return cells, values, iterations, lengths.astype(np.int64)
 
 
 class CMetric(Metric):
+	"""
+	Metric of the course of a run, calculated over the values of a field on
+	every iteration. The values are truncated to integers as they are read.
+	calculate takes the results of one run; calculate_array takes the
+	stacked values of process_array, so that a whole grid run and all its
+	fields are calculated in one call.
+	"""
 	def __init__(self, name:str = 'generic_c_metric'):
 		Metric.__init__(self, name)
 
 	def calculate(self, result: dict, **args):
-		return self._calculate(result, **args)
+		values, iterations, lengths = process_array([result], [args['field']])
+		value = self.calculate_array(values, iterations, lengths)[0, 0]
+		return value.item() if isinstance(value, np.generic) else value
 
-	def _calculate(self, result: dict, **args):
-		_result = 0
-		for iter, values in result.items():
-			_result += self._get(iter, values, args['field'])
-		return _result
+	def calculate_array(self, values, iterations, lengths):
+		"""
+		:param values: values, np.array of float of runs x iterations x fields
+		:param iterations: iteration numbers, np.array of int of runs x iterations
+		:param lengths: number of iterations of every run, np.array of int
+		:return: metric of every run and field, np.array of runs x fields
+		"""
+		valid = np.arange(values.shape[1]) < lengths[:, None]
+		return self._calculate_array(np.trunc(values), iterations[:, :, None],
+		                             valid[:, :, None], values)
 
-	def _get(self, iter, values, field):
-		return 0
+	def _calculate_array(self, values, iterations, valid, raw):
+		return np.zeros((values.shape[0], values.shape[2]), dtype=np.int64)
+
+	def _steps(self, values, iterations, valid):
+		"""
+		Function that gives the drop of the values from every iteration to
+		the next one, counted for the iterations after the first
+		:return: drops and whether they count, tuple of np.array of runs x
+		(iterations - 1) x fields
+		"""
+		steps = valid[:, 1:] & (iterations[:, 1:] > 0)
+		return np.where(steps, values[:, :-1] - values[:, 1:], 0), steps
 
 
 class XYMetric(CMetric):
+	"""
+	Sum over the iterations of the iteration number where it equals the
+	value, 0 where it is below it and the previous iteration number where
+	it is above it, up to the first iteration that makes the sum positive.
+	"""
 	def __init__(self, name: str='xy'):
 		CMetric.__init__(self, name)
 
-	def _calculate(self, result: dict, **args):
-		_result = 0
-		for iter, values in result.items():
-			_result += self._get(iter, values, args['field'])
-			if _result > 0:
-				return _result
-		return _result
-
-	def _get(self, iter, values, field):
-		"""
-		:param iter:
-		:param values:
-		:param field: json field to take the values from
-		:return:
-		"""
-		if int(iter) == int(values[field]):
-			return iter
-		elif int(iter) < int(values[field]):
-			return 0
-		else:
-			return int(iter) - 1
+	def _calculate_array(self, values, iterations, valid, raw):
+		terms = np.where(iterations == values, iterations,
+		                 np.where(iterations < values, 0, iterations - 1))
+		sums = np.cumsum(np.where(valid, terms, 0), axis=1)
+		if sums.shape[1] == 0:
+			return np.zeros((sums.shape[0], sums.shape[2]), dtype=np.int64)
+		positive = sums > 0
+		first = np.take_along_axis(sums, np.argmax(positive, axis=1)[:, None], axis=1)[:, 0]
+		return np.where(np.any(positive, axis=1), first, sums[:, -1]).astype(np.int64)
 
 
 class TotalClusterSumMetric(CMetric):
+	"""
+	Sum of the values over the iterations.
+	"""
 	def __init__(self, name: str='total_sum'):
 		CMetric.__init__(self, name)
 
-	def _get(self, iter, values, field):
-		return int(values[field])
+	def _calculate_array(self, values, iterations, valid, raw):
+		return np.sum(np.where(valid, values, 0), axis=1).astype(np.int64)
 
 
 class TotalNRClusterSumMetric(CMetric):
+	"""
+	Sum of the values over the iterations, leaving out the values that
+	repeat the one of the previous iteration.
+	"""
 	def __init__(self, name: str='total_nr_sum'):
 		CMetric.__init__(self, name)
 
-	def _calculate(self, result: dict, **args):
-		_result = 0
-		_prev_values = 0
-		for iter, values in result.items():
-			if self._get(iter, values, args['field']) != _prev_values:
-				_result += self._get(iter, values, args['field'])
-			_prev_values = values
-		return _result
-
-	def _get(self, iter, values, field):
-		return int(values[field])
+	def _calculate_array(self, values, iterations, valid, raw):
+		previous = np.concatenate([np.zeros_like(values[:, :1]), values[:, :-1]], axis=1)
+		return np.sum(np.where(valid & (values != previous), values, 0), axis=1).astype(np.int64)
 
 
 class MaxClusterVariationMetric(CMetric):
+	"""
+	Largest drop of the values from one iteration to the next, 0 if they
+	never drop.
+	"""
 	def __init__(self, name: str='max_variation'):
 		CMetric.__init__(self, name)
 
-	def _calculate(self, result: dict, **args):
-		_result = 0
-		_prev_values = 0
-		for iter, values in result.items():
-			if int(iter) > 0:
-				_result = max(_result, self._get(_prev_values, values, args['field']))
-			_prev_values = values
-		return _result
-
-	def _get(self, prev_values, values, field):
-		return int(prev_values[field]) - int(values[field])
+	def _calculate_array(self, values, iterations, valid, raw):
+		drops, _ = self._steps(values, iterations, valid)
+		return np.max(drops, axis=1, initial=0).astype(np.int64)
 
 
 class IterMaxClusterVariationMetric(CMetric):
+	"""
+	Iteration after which the values drop the most, the first one on ties.
+	"""
 	def __init__(self, name: str='iter_max_variation'):
 		CMetric.__init__(self, name)
 
-	def _calculate(self, result: dict, **args):
-		_result = []
-		_prev_values = 0
-		iter = 0
-
-		for iter, values in result.items():
-			if int(iter) > 0:
-				_result.append(self._get(_prev_values, values, args['field']))
-			_prev_values = values
-		return list(range(int(iter) + 1))[_result.index(max(_result))]
-
-	def _get(self, prev_values, values, field):
-		return int(prev_values[field]) - int(values[field])
+	def _calculate_array(self, values, iterations, valid, raw):
+		drops, steps = self._steps(values, iterations, valid)
+		if drops.shape[1] == 0:
+			return np.zeros((drops.shape[0], drops.shape[2]), dtype=np.int64)
+		return np.argmax(np.where(steps, drops, -np.inf), axis=1).astype(np.int64)
 
 
 class ClustersReductionMetric(CMetric):
+	"""
+	Iterations on which the values drop by at least percent of the value of
+	the previous iteration.
+	"""
 	def __init__(self, name: str='clusters_reduction_distance'):
 		CMetric.__init__(self, name)
 		self.percent = 0.5
 
-	def _calculate(self, result: dict, **args):
-		_result =[]
-		_prev_values = 0
-		for iter, values in result.items():
-			if int(iter) > 0:
-				if self._get(_prev_values, values, args['field']):
-					_result.append(iter)
-			_prev_values = values
-		return _result
-
-	def _get(self, prev_values, values, field):
-		diff = int(prev_values[field]) - int(values[field])
-		return diff >= prev_values[field] * self.percent
+	def _calculate_array(self, values, iterations, valid, raw):
+		drops, steps = self._steps(values, iterations, valid)
+		reduced = steps & (drops >= raw[:, :-1] * self.percent)
+		result = np.empty((values.shape[0], values.shape[2]), dtype=object)
+		for run, field in np.ndindex(result.shape):
+			result[run, field] = iterations[run, 1:, 0][reduced[run, :, field]].tolist()
+		return result
 
 
 class Calculator:
@@ -1,18 +1,27 @@
 import argparse
+from collections import Counter
 import geopandas as gpd
+import glob
+import os
 import pandas as pd
 from shapely.geometry import MultiPolygon
 import sys
 import textwrap
 
 sys.path.append('scripts/')
-from config import METRICS, CANVAS, PROCESS_METRICS
+from config import METRICS, CANVAS, PROCESS_METRICS, INCREMENTAL_TOLERANCE
 from grid import Grid, CellCalculator
 from metrics import Metric, CMetric, ClusterNumberMetric, MinimumClusterDistanceMetric, \
-	MetricFactory, ProcessMetricFactory
-from polygon import Reader, Collection, Footprint, Iteration, Uniter, Shifter
-from visualizer import Visualizer
-from writer import JsonWriter, CsvWriter
+	DlimitMetric, MetricFactory, ProcessMetricFactory, Intermediates, process_array, \
+	stack_results
+from dendrogram import Dendrogram
+from executor import ExecutorFactory, PoolExecutor, Prefetcher, Sink
+from polygon import Reader, Collection, Footprint, Iteration, Uniter, Shifter, \
+	ComponentUniter, Simplifier, Snapper, membership, convex_hull
+from shared import SharedGeometries
+from visualizer import Visualizer, FrameWriter
+from writer import JsonWriter, CsvWriter, LabelWriter, ColumnarWriter, Manifest, \
+	merge_results, process_filename, shard_filename
 
 
 class Pipeline:
@@ -51,9 +60,7 @@ class CollectionPipeline(Pipeline):
 
 	def _run(self):
 		df = self.reader.read(self.filename)
-		collection = Collection(Footprint)
-		for geometry in df:
-			collection = Uniter().make(collection, Footprint(geometry))
+		collection = ComponentUniter().merge(df)
 		del df
 		return Shifter().make(collection)
 
@@ -62,13 +69,18 @@ class MetricsPipeline(Pipeline):
 	"""
 	Pipeline that calculates metrics for a particular collection.
 	Returns dictionary of metrics calculated for a given collection.
+	The intermediate products the metrics declare in REQUIRES are shared
+	through one Intermediates per collection and built on first use.
 	"""
-	def __init__(self, filename):
+	def __init__(self, filename, metrics=None):
 		Pipeline.__init__(self)
 		self.filename = filename
+		if metrics is None:
+			metrics = METRICS
 		self.metric_collection = Collection(Metric)
-		for metric in METRICS:
+		for metric in metrics:
 			self.metric_collection.add(MetricFactory().produce(metric))
+		self.initial_dlimit = None
 		print('metrics ready')
 
 	def run(self, collection=None, **args):
@@ -77,6 +89,11 @@ class MetricsPipeline(Pipeline):
 	def _run(self, collection, **args):
 		if collection is None:
 			collection = CollectionPipeline(self.filename).run()
+		args['intermediates'] = Intermediates(collection, [args.get('hull'), args.get('sample')],
+		                                      args.get('initial_collection'))
+		if 'initial_collection' in args and 'initial_dlimit' not in args and \
+				'initial_dlimit' in self.requires():
+			args['initial_dlimit'] = self._initial_dlimit(args['initial_collection'])
 		result = {}
 
 		for metric in self.metric_collection:
@@ -84,29 +101,101 @@ class MetricsPipeline(Pipeline):
 
 		return result
 
+	def requires(self):
+		"""
+		:return: intermediate products the metrics need, set of str
+		"""
+		return {x for metric in self.metric_collection for x in metric.REQUIRES}
+
+	def _initial_dlimit(self, initial_collection):
+		"""
+		Function that calculates the Dlimit of the initial collection once per run
+		:return: Dlimit, float
+		"""
+		if self.initial_dlimit is None or self.initial_dlimit[0] is not initial_collection:
+			self.initial_dlimit = (initial_collection,
+			                       DlimitMetric().calculate(initial_collection))
+		return self.initial_dlimit[1]
+
 
 class ProcessMetricsPipeline(Pipeline):
 	"""
-	Pipeline that calculates metrics for a particular collection.
-	Returns dictionary of metrics calculated for a given collection.
+	Pipeline that calculates the process metrics over the given fields of
+	every iteration, cluster_number and total_area by default. Any numeric
+	metric can be a field. The values are stacked in a runs x iterations x
+	fields array and every metric is calculated over all of it at once, for
+	one run with run, several with run_cells or the whole output of a grid
+	run with run_grid. MainPipeline and GridPipeline take their fields as
+	process_fields.
 	"""
-	def __init__(self, filename):
+	FIELDS = ['cluster_number', 'total_area']
+
+	def __init__(self, filename, fields=None):
 		Pipeline.__init__(self)
 		self.filename = filename
+		self.fields = self.FIELDS if fields is None else fields
 		self.metric_collection = Collection(Metric)
 		for metric in PROCESS_METRICS:
 			self.metric_collection.add(ProcessMetricFactory().produce(metric))
 		print('metrics ready')
 
+	@staticmethod
+	def select(metrics=None, fields=None):
+		"""
+		:param metrics: metrics of the iterations, list of str
+		:param fields: fields to calculate the process metrics over, they have
+		to be among the metrics, list of str; the default fields among the
+		metrics by default
+		:return: process fields, list of str
+		"""
+		if fields is None:
+			return ProcessMetricsPipeline.FIELDS if metrics is None else \
+				[x for x in ProcessMetricsPipeline.FIELDS if x in metrics]
+		for field in fields:
+			assert metrics is None or field in metrics, \
+				"Process field {} is not among the metrics".format(field)
+		return list(dict.fromkeys(fields))
+
+	@staticmethod
+	def names(fields=None):
+		"""
+		:param fields: fields the process metrics are calculated over, list of str
+		:return: names of the process metrics, list of str
+		"""
+		fields = ProcessMetricsPipeline.FIELDS if fields is None else fields
+		return ['{}_{}'.format(y, x) for x in PROCESS_METRICS for y in fields]
+
 	def run(self, values: dict, **args):
 		return self._run(values, **args)
 
 	def _run(self, values, **args):
-		result = {}
-		for field in ['cluster_number', 'total_area']:
-			for metric in self.metric_collection:
-				result['{}_{}'.format(field, metric.name)] = metric.calculate(values, field=field)
-		return result
+		return self.run_cells([values])[0]
+
+	def run_cells(self, results):
+		"""
+		:param results: metric values by iteration of every run, list of dict
+		:return: process metrics of every run, list of dict
+		"""
+		return self._calculate(*process_array(results, self.fields))
+
+	def run_grid(self, df):
+		"""
+		:param df: metrics of a grid run, one row per cell and iteration, as
+		read_results gives them, pd.DataFrame
+		:return: process metrics, one row per cell, pd.DataFrame
+		"""
+		cells, values, iterations, lengths = stack_results(df, self.fields)
+		return pd.DataFrame(self._calculate(values, iterations, lengths),
+		                    index=pd.Index(cells, name='cell'))
+
+	def _calculate(self, values, iterations, lengths):
+		arrays = {metric.name: metric.calculate_array(values, iterations, lengths)
+		          for metric in self.metric_collection}
+		columns = {}
+		for name, array in arrays.items():
+			for j, field in enumerate(self.fields):
+				columns['{}_{}'.format(field, name)] = array[:, j].tolist()
+		return [{x: y[i] for x, y in columns.items()} for i in range(len(values))]
 
 
 class IterPipeline(Pipeline):
@@ -114,10 +203,11 @@ class IterPipeline(Pipeline):
 	Pipeline that makes one iteration of growth on a given value.
 	Returns a new Collection.
 	"""
-	def __init__(self, filename, value=0):
+	def __init__(self, filename, value=0, grower=None):
 		Pipeline.__init__(self)
 		self.filename = filename
 		self.value = value
+		self.grower = grower
 
 	def run(self, collection=None):
 		return self._run(collection)
@@ -125,18 +215,121 @@ class IterPipeline(Pipeline):
 	def _run(self, collection):
 		if collection is None:
 			collection = CollectionPipeline(self.filename).run()
-		return Iteration(collection, self.value).make()
+		return Iteration(collection, self.value, self.grower).make()
+
+
+def run_cell(task):
+	"""
+	Function that runs the MainPipeline on one grid cell. Errors are caught
+	and returned so that one bad cell does not stop the grid run.
+	:param task: cell index, building ids, cell buildings or the shared
+	buildings of the run, cell polygon and MainPipeline options, tuple
+	:return: cell index, error message, None on success, and the metrics of
+	the cell, None on failure, tuple
+	"""
+	i, ids, buildings, cell, options = task
+	if isinstance(buildings, SharedGeometries):
+		buildings = buildings.get(ids)
+	try:
+		_collection = ComponentUniter().merge(buildings)
+		print('LEN', len(_collection))
+		output = MainPipeline(filename='{}'.format(i), **options).run(collection=_collection,
+		                                                               sample=cell)
+	except Exception as e:
+		return i, '{}: {}'.format(type(e).__name__, e), None
+	return i, None, output
+
+
+# what the iterations of a MainPipeline share, kept in every worker process
+# by install_iteration so that the tasks only carry their buffer value
+_iteration = {}
+
+
+def install_iteration(pipe, m_pipe, tree, collection, hull):
+	"""
+	Function that keeps what the iterations of a MainPipeline share in the
+	current process, the initializer of the iteration pool
+	:param pipe: pipeline, MainPipeline
+	:param m_pipe: metrics pipeline, MetricsPipeline
+	:param tree: merge tree or None, Dendrogram
+	:param collection: initial collection, Collection
+	:param hull: convex hull of the initial collection, Polygon
+	"""
+	_iteration.update(pipe=pipe, m_pipe=m_pipe, tree=tree, collection=collection, hull=hull)
+
+
+def run_iteration(value):
+	"""
+	Function that makes one iteration of a MainPipeline in a worker process
+	set up by install_iteration
+	:param value: buffer value, int
+	:return: metric values, labels and frame, tuple
+	"""
+	_, result, labels, frame = _iteration['pipe']._iterate(
+		_iteration['m_pipe'], _iteration['tree'], _iteration['collection'], None, value,
+		_iteration['hull'])
+	return result, labels, frame
 
 
 class GridPipeline(Pipeline):
 	"""
-	Pipeline that makes one iteration of growth on a given value.
-	Returns a new Collection.
+	Pipeline that runs the MainPipeline on every cell of a grid.
+	Cells are processed one after another, or by a pool of worker processes
+	if more than one worker is given.
+	When streaming, the buildings of every cell are read from disk on their
+	own instead of loading the whole city at once.
+	The metrics of all the cells are saved to a single file keyed by cell and
+	iteration, and the process metrics to a second one keyed by cell. With
+	export_csv every cell also gets its own csv files as MainPipeline saves them;
+	they are written by the writing stage, from the metrics the cell returns.
+	Completed cells are recorded in a manifest next to the output. With resume
+	they are skipped, and whatever an interrupted cell had written is dropped.
+	Only the given metrics are calculated, config.METRICS by default, and the
+	process metrics over process_fields, see ProcessMetricsPipeline.select.
+	The cells go through three stages connected by queues of queue_size
+	cells: a thread reads the buildings of the next cells, the executor
+	computes them, and another thread writes the finished ones. The frames,
+	videos and membership files of a cell are still written by the process
+	that computes it, as they are too large to send back. A stage
+	waits when the queue after it is full, so reading never runs far ahead
+	of computing and at most a few cells are held in memory. The pool takes
+	at most two cells per worker at a time.
+	With a shard (K, N) only the cells whose index leaves K - 1 divided by N
+	are run, and the outputs get a .shard-K-of-N suffix. MergePipeline
+	combines the outputs of all the shards.
+	When the whole city is loaded and the cells are run by a pool, the
+	buildings are put in shared memory once and the tasks only carry the
+	building ids of their cell, instead of every cell pickling its buildings.
 	"""
-	def __init__(self, filename, value=0):
+	def __init__(self, filename, value=0, workers=1, engine='geometry', incremental=False,
+	             membership=False, iteration_workers=1, streaming=False,
+	             output='result/grid.ndjson', export_csv=False, resume=False, video=False,
+	             metrics=None, queue_size=4, shard=None, process_fields=None):
 		Pipeline.__init__(self)
+		if shard is not None:
+			assert 1 <= shard[0] <= shard[1], "Expected shard K/N with 1 <= K <= N, got " \
+			                                  "{}/{}".format(*shard)
+			output = shard_filename(output, shard)
 		self.filename = filename
 		self.value = value
+		self.streaming = streaming
+		self.output = output
+		self.shard = shard
+		self.resume = resume
+		self.export_csv = export_csv
+		self.queue_size = queue_size
+		self.metrics = METRICS if metrics is None else metrics
+		self.process_fields = ProcessMetricsPipeline.select(self.metrics, process_fields)
+		self.reader = Reader()
+		self.executor = ExecutorFactory().produce(workers)
+		self.options = {'value': value, 'video': video,
+		                'engine': engine, 'incremental': incremental,
+		                'membership': membership, 'iteration_workers': iteration_workers,
+		                'export_csv': False, 'metrics': self.metrics,
+		                'process_fields': self.process_fields}
+		self.failed = {}
+		self.empty = set()
+		self.shared = None
 
 	def run(self, shapefile=None):
 		return self._run(shapefile)
@@ -144,20 +337,296 @@ class GridPipeline(Pipeline):
 	def _run(self, shapefile):
 		_grid = Grid(shapefile)
 		_cellcalc = CellCalculator(_grid)
-		buildings = Reader().read(self.filename)
-		for i in range(len(_grid.grid)):
-			_collection, _cell = _cellcalc.get(buildings, i)
-			if len(_collection) > 0:
-				print('LEN', len(_collection))
-				MainPipeline(filename='{}'.format(i)).run(collection =_collection, sample=_cell)
-				print('Iteration {} finished executing'.format(i))
+		writer, process_writer = self._writers()
+		files = [writer.filename, process_writer.filename]
+		manifest = Manifest(writer.filename + '.manifest.json', run=self._identity(shapefile))
+		if self.resume:
+			manifest.load().truncate(files)
+			print('Resuming, {} cells already completed'.format(len(manifest.cells())))
+		else:
+			# the manifest of an earlier run would describe files this run replaces
+			manifest.save()
+		tasks = Prefetcher(self._tasks(_grid, _cellcalc, manifest.cells()), self.queue_size)
+		sink = Sink(lambda x: self._save(x, writer, process_writer, manifest),
+		            self.queue_size)
+		try:
+			for item in self.executor.map(run_cell, tasks):
+				sink.add(item)
+			sink.close()
+		finally:
+			if self.shared is not None:
+				self.shared.close()
+				self.shared = None
+		writer.save()
+		process_writer.save()
+		manifest.skip(self.empty, len(_grid.grid))
+		manifest.save()
+		if self.reader.repaired:
+			print('{} invalid footprints repaired'.format(self.reader.repaired))
+		if self.failed:
+			print('{} cells failed: {}'.format(len(self.failed), sorted(self.failed)))
+		return self.failed
+
+	def _identity(self, shapefile):
+		"""
+		:param shapefile: path to the grid shapefile, str
+		:return: the inputs and settings that decide what the run saves, as
+		the manifest records them, dict
+		"""
+		run = {'buildings': self.filename, 'grid': shapefile, 'metrics': list(self.metrics),
+		       'value': self.options['value'], 'engine': self.options['engine'],
+		       'incremental': self.options['incremental'],
+		       'membership': self.options['membership'],
+		       'process_fields': self.process_fields}
+		if self.shard is not None:
+			run['shard'] = list(self.shard)
+		return run
+
+	def _save(self, item, writer, process_writer, manifest):
+		"""
+		Function that writes the metrics of one cell and records it as
+		completed, or records its error
+		:param item: cell index, error message and metrics, tuple
+		"""
+		i, error, output = item
+		if error is not None:
+			self.failed[i] = error
+			print('Cell {} failed: {}'.format(i, error))
+			return
+		for iteration, result in output['iterations'].items():
+			writer.add((i, iteration), result)
+		process_writer.add((i,), output['process'])
+		if self.export_csv:
+			MainPipeline('{}'.format(i), metrics=self.metrics,
+			             process_fields=self.process_fields).save(output['iterations'],
+			                                                      output['process'])
+		writer.flush()
+		process_writer.flush()
+		manifest.add(i, self._outputs(i), [writer.filename, process_writer.filename])
+		manifest.save()
+		print('Iteration {} finished executing'.format(i))
+
+	def _writers(self):
+		"""
+		Function that makes the writers of the metrics and of the process metrics
+		:return: metrics writer and process metrics writer, tuple of ColumnarWriter
+		"""
+		writer = ColumnarWriter(self.output, self.metrics, keys=['cell', 'iter'],
+		                        append=self.resume)
+		process_writer = ColumnarWriter(process_filename(writer.filename),
+		                                ProcessMetricsPipeline.names(self.process_fields),
+		                                keys=['cell'],
+		                                append=self.resume)
+		return writer, process_writer
+
+	def _outputs(self, i):
+		"""
+		:param i: cell index, int
+		:return: files MainPipeline saved for the cell, list of str
+		"""
+		outputs = []
+		if self.export_csv:
+			outputs += ['result/{}.csv'.format(i), 'result/{}_process.csv'.format(i)]
+		if self.options['membership']:
+			outputs.append('result/{}_membership.csv'.format(i))
+		if self.options['value'] and self.options['video']:
+			outputs.append('vis/{}.mp4'.format(i))
+		return outputs
+
+	def cells(self, _grid):
+		"""
+		:param _grid: grid of the run, Grid
+		:return: cells of the shard, all of them without a shard, list of int
+		"""
+		if self.shard is None:
+			return list(range(len(_grid.grid)))
+		return list(range(self.shard[0] - 1, len(_grid.grid), self.shard[1]))
+
+	def _tasks(self, _grid, _cellcalc, completed=()):
+		"""
+		Generator of the run_cell tasks of all the non-empty cells of the
+		shard. The empty cells are recorded in self.empty.
+		:param completed: cells to skip, set of int
+		:return: cell index, building ids, cell buildings, cell polygon and
+		options, tuple
+		"""
+		if self.streaming:
+			for i in self.cells(_grid):
+				if i in completed:
+					continue
+				ids, buildings = _cellcalc.read(self.filename, i, self.reader)
+				if len(buildings) > 0:
+					yield i, ids, buildings, _grid.grid[i], self.options
+				else:
+					self.empty.add(i)
+		else:
+			buildings = self.reader.read(self.filename)
+			assignment = _cellcalc.assign(buildings)
+			if isinstance(self.executor, PoolExecutor):
+				self.shared = SharedGeometries(buildings)
+			for i in self.cells(_grid):
+				if len(assignment[i]) == 0:
+					self.empty.add(i)
+				elif i not in completed:
+					cell_buildings = self.shared if self.shared is not None else \
+						[buildings[k] for k in assignment[i]]
+					yield i, assignment[i], cell_buildings, _grid.grid[i], self.options
+
+
+class MergePipeline(Pipeline):
+	"""
+	Pipeline that merges the outputs of the shards of a grid run into the
+	files and the manifest a run on one machine saves. Every shard has to be
+	there once and finished, with every one of its cells either completed or
+	empty, and no cell or iteration may be saved twice. Otherwise nothing is
+	merged and the problems are reported.
+	"""
+	def __init__(self, output='result/grid.ndjson'):
+		"""
+		:param output: path of the merged metrics, as given to the shards, str
+		"""
+		Pipeline.__init__(self)
+		self.output = ColumnarWriter(output).filename
+
+	def run(self, partials=None):
+		return self._run(partials)
+
+	def _run(self, partials):
+		"""
+		:param partials: metrics files of the shards, all the shard files next
+		to the output by default, list of str. A shard whose manifest records
+		no completed cell may have no files.
+		:return: merged cells, list of int
+		"""
+		if not partials:
+			# found through the manifests, a shard without rows may have no metrics file
+			name, extension = os.path.splitext(self.output)
+			manifests = glob.glob('{}.shard-*-of-*{}.manifest.json'.format(glob.escape(name),
+			                                                                extension))
+			partials = sorted(x[:-len('.manifest.json')] for x in manifests)
+		if not partials:
+			print('No shard outputs found next to {}'.format(self.output))
+			raise ValueError
+		manifests = [Manifest(x + '.manifest.json').load(strict=False) for x in partials]
+		run, total = self._check(partials, manifests)
+		sizes = {}
+		for manifest in manifests:
+			sizes.update(manifest.content['sizes'])
+		cells = merge_results(partials, self.output, ['cell', 'iter'], sizes)
+		process_cells = merge_results([process_filename(x) for x in partials],
+		                              process_filename(self.output), ['cell'], sizes)
+		for filename, manifest, _cells, _process_cells in zip(partials, manifests, cells,
+		                                                     process_cells):
+			if _cells != manifest.cells() or _process_cells != manifest.cells():
+				print('{} does not hold the cells its manifest records'.format(filename))
+				raise ValueError
+		merged = Manifest(self.output + '.manifest.json', run=run)
+		empty = []
+		for manifest in manifests:
+			merged.content['cells'].update(manifest.content['cells'])
+			empty += manifest.content['empty']
+		merged.content['sizes'] = {x: os.path.getsize(x) for x in
+		                           [self.output, process_filename(self.output)]}
+		merged.skip(empty, total)
+		merged.save()
+		print('{} shards merged into {}, {} cells'.format(len(partials), self.output,
+		                                                 len(merged.cells())))
+		return sorted(merged.cells())
+
+	def _check(self, partials, manifests):
+		"""
+		Function that checks that the shards belong to one run, that all of
+		them are there once and that they completed all their cells
+		:return: settings of the whole run and number of grid cells, tuple
+		"""
+		errors = []
+		runs = []
+		for filename, manifest in zip(partials, manifests):
+			content = manifest.content
+			if 'shard' not in content['run']:
+				errors.append('{} has no shard manifest'.format(filename))
+			elif 'grid_cells' not in content:
+				errors.append('{} is not finished'.format(filename))
+			runs.append({x: y for x, y in content['run'].items() if x != 'shard'})
+		if not errors:
+			shards = [tuple(x.content['run']['shard']) for x in manifests]
+			n_shards = shards[0][1]
+			total = manifests[0].content['grid_cells']
+			if any(x != runs[0] for x in runs) or any(x[1] != n_shards for x in shards) or \
+					any(x.content['grid_cells'] != total for x in manifests):
+				errors.append('The shards belong to different runs')
+			numbers = [x[0] for x in shards]
+			duplicated = sorted({x for x in numbers if numbers.count(x) > 1})
+			missing = sorted(set(range(1, n_shards + 1)) - set(numbers))
+			if duplicated:
+				errors.append('Shards given more than once: {}'.format(duplicated))
+			if missing:
+				errors.append('Missing shards: {}'.format(missing))
+			cells = []
+			for (number, _), manifest in zip(shards, manifests):
+				done = manifest.cells() | set(manifest.content['empty'])
+				expected = set(range(number - 1, total, n_shards))
+				cells += sorted(done)
+				if done - expected:
+					errors.append('Shard {} holds cells of other shards: {}'.format(
+						number, sorted(done - expected)))
+				if expected - done:
+					errors.append('Shard {} did not complete cells {}'.format(
+						number, sorted(expected - done)))
+			duplicated = sorted(x for x, count in Counter(cells).items() if count > 1)
+			if duplicated:
+				errors.append('Cells saved more than once: {}'.format(duplicated))
+		if errors:
+			for error in errors:
+				print(error)
+			raise ValueError
+		return runs[0], total
 
 
 class MainPipeline(Pipeline):
-	def __init__(self, filename, value=0):
+	"""
+	Pipeline that grows a collection until a unique cluster is formed and
+	saves the metrics of every iteration.
+	The 'geometry' engine grows the collection on every iteration. The
+	'dendrogram' engine reads the count-based metrics from the single-linkage
+	merge tree and only grows the collection for the other metrics.
+	In incremental mode every iteration grows the clusters of the previous
+	iteration by one step instead of growing the original footprints. The
+	grown clusters are simplified by INCREMENTAL_TOLERANCE, otherwise every
+	step adds arc vertices to the ones of the previous step, and snapped to a
+	grid of the same size, which closes the slivers narrower than it where
+	two fronts nearly meet.
+	With membership the cluster of every footprint on every iteration is
+	saved as well.
+	With a value every iteration is drawn, to one png per iteration in the vis
+	folder or, with video, to one video per MainPipeline. The frames are saved
+	on a background thread.
+	The metrics, config.METRICS by default, are saved to csv files in the
+	result folder unless export_csv is off; they are returned either way.
+	The process metrics are calculated over process_fields, see
+	ProcessMetricsPipeline.select.
+	With more than one iteration worker the iterations, which only depend on
+	the initial collection, are computed in parallel up to the iteration at
+	which the merge tree says a unique cluster is formed.
+	"""
+	def __init__(self, filename, value=0, engine='geometry', incremental=False,
+	             membership=False, iteration_workers=1, export_csv=True, video=False,
+	             metrics=None, process_fields=None):
 		Pipeline.__init__(self)
+		assert engine in ['geometry', 'dendrogram'], "Unknown engine {}".format(engine)
+		assert not (incremental and iteration_workers > 1), \
+			"Incremental iterations cannot be computed in parallel"
 		self.filename = filename
 		self.value = value
+		self.engine = engine
+		self.incremental = incremental
+		self.membership = membership
+		self.iteration_workers = iteration_workers
+		self.export_csv = export_csv
+		self.video = video
+		self.metrics = METRICS if metrics is None else metrics
+		assert 'cluster_number' in self.metrics, "cluster_number is needed to stop the iterations"
+		self.process_fields = ProcessMetricsPipeline.select(self.metrics, process_fields)
 
 	def run(self, collection=None,**args):
 		return self._run(collection, **args)
@@ -169,41 +638,144 @@ class MainPipeline(Pipeline):
 		sample = None
 		if 'sample' in list(args.keys()):
 			sample = args['sample']
-		hull = MultiPolygon(
-			[x.polygon for x in collection.collection]).convex_hull
-		m_pipe = MetricsPipeline(self.filename)
-		result = m_pipe.run(collection, initial_collection=collection,
-		                    hull=hull, sample=sample)
-
-		writer = CsvWriter(filename='result/' + self.filename.split('.')[0], features=METRICS)
-		writer.add("{}".format(0), result)
-
-		# v = Visualizer(collection, name='{}_iter'.format(n)).visualize()
+		hull = convex_hull(collection)
+		tree = None
+		metrics = self.metrics
+		if self.engine == 'dendrogram':
+			tree = Dendrogram(collection)
+			metrics = [x for x in self.metrics if x not in Dendrogram.METRICS]
+		m_pipe = MetricsPipeline(self.filename, metrics)
+		result = self._calculate(m_pipe, tree, collection, collection, 0,
+		                         hull=hull, sample=sample)
+
+		writer = CsvWriter(filename='result/' + self.filename.split('.')[0], features=self.metrics)
+		writer.add(0, result)
+		label_writer = LabelWriter(
+			filename='result/{}_membership'.format(self.filename.split('.')[0]))
+		if self.membership:
+			label_writer.add(0, self._labels(tree, collection, collection, 0))
+
+		name = self.filename.split('.')[0]
+		frames = FrameWriter(name, video=self.video) if self.value else None
 		n_clusters = 100
 		i = 1
+		if self.iteration_workers > 1:
+			bound = (tree if tree is not None else Dendrogram(collection)).n_iterations() + 1
+			executor = ExecutorFactory().produce(self.iteration_workers,
+			                                     initializer=install_iteration,
+			                                     initargs=(self, m_pipe, tree, collection, hull))
+			# leaving the loop cancels the iterations that have not started
+			for result, labels, frame in executor.map(run_iteration, range(1, bound + 1)):
+				n_clusters = result['cluster_number']
+				print('Number of clusters:    {}'.format(n_clusters))
+				writer.add(i, result)
+				if self.membership:
+					label_writer.add(i, labels)
+				if frames is not None:
+					frames.add('{}_{}_iter'.format(name, i), frame)
+				i += 1
+				if n_clusters == 1:
+					break
+		previous = collection
 		while n_clusters != 1:
-			_collection = IterPipeline(self.filename, i).run(collection)
-			result = m_pipe.run(_collection, initial_collection=collection,
-			                    hull=hull)
+			_collection, result, labels, frame = self._iterate(m_pipe, tree, collection,
+			                                                   previous, i, hull)
 			n_clusters = result['cluster_number']
 			print('Number of clusters:    {}'.format(n_clusters))
 			writer.add(i, result)
-			if self.value:
-				v = Visualizer(_collection,
-				               name='{}_iter'.format(i)).visualize()
-				del v
+			if self.membership:
+				label_writer.add(i, labels)
+			if frames is not None:
+				frames.add('{}_{}_iter'.format(name, i), frame)
+			previous = _collection
 			del _collection
 			del result
 			i += 1
+		if frames is not None:
+			frames.close()
+		if self.membership:
+			label_writer.save()
+		process_pipe = ProcessMetricsPipeline(self.filename, self.process_fields).run(writer.content)
+		if self.export_csv:
+			self.save(writer.content, process_pipe)
+		return {'iterations': writer.content, 'process': process_pipe}
+
+	def save(self, iterations, process):
+		"""
+		Function that saves the metrics of a run to the csv files of the result folder
+		:param iterations: metric values by iteration, dict
+		:param process: process metric values, dict
+		"""
+		name = self.filename.split('.')[0]
+		writer = CsvWriter(filename='result/' + name, features=self.metrics)
+		for i, result in iterations.items():
+			writer.add(i, result)
 		writer.save()
-		process_writer = CsvWriter(filename='result/{}_process'.format(self.filename.split('.')[0]),
-		                           features=['{}_{}'.format(y, x) for x in
-		                                     PROCESS_METRICS for y in
-		                                     ['cluster_number', 'total_area']])
-		process_pipe = ProcessMetricsPipeline(self.filename).run(writer.content)
-		process_writer.add('whole', process_pipe)
+		process_writer = CsvWriter(filename='result/{}_process'.format(name),
+		                           features=ProcessMetricsPipeline.names(self.process_fields))
+		process_writer.add('whole', process)
 		process_writer.save()
 
+	def _iterate(self, m_pipe, tree, collection, previous, value, hull):
+		"""
+		Function that makes one iteration: grows the collection, calculates
+		its metrics and labels and draws it
+		:return: grown collection, metric values, labels and frame, tuple
+		"""
+		_collection = self._grow(m_pipe, tree, collection, previous, value)
+		result = self._calculate(m_pipe, tree, _collection, collection, value,
+		                         hull=hull)
+		labels = None
+		if self.membership:
+			labels = self._labels(tree, _collection, collection, value)
+		frame = None
+		if self.value:
+			frame = Visualizer(_collection).render()
+		return _collection, result, labels, frame
+
+	def _grow(self, m_pipe, tree, collection, previous, value):
+		"""
+		Function that grows the collection, unless the merge tree answers
+		all the metrics and nothing has to be visualized
+		:param collection: initial collection, Collection
+		:param previous: collection of the previous iteration, Collection
+		:param value: buffer value of the iteration, int
+		:return: grown collection or None, Collection
+		"""
+		if tree is not None and len(m_pipe.metric_collection) == 0 and not self.value:
+			return None
+		if self.incremental and previous is not None:
+			new = Simplifier().make(IterPipeline(self.filename, 1).run(previous),
+			                        INCREMENTAL_TOLERANCE, preserve_topology=False)
+			return Snapper().make(new, INCREMENTAL_TOLERANCE)
+		return IterPipeline(self.filename, value).run(collection)
+
+	def _labels(self, tree, _collection, collection, value):
+		"""
+		Function that finds the cluster of every original footprint
+		:return: cluster indices, np.array of int
+		"""
+		if _collection is not None:
+			labels = membership(_collection, collection)
+		else:
+			labels = tree.labels(value)
+		if collection.labels is not None:
+			labels = labels[collection.labels]
+		return labels
+
+	def _calculate(self, m_pipe, tree, _collection, collection, value, **args):
+		"""
+		Function that calculates the metrics of one iteration in self.metrics order
+		:return: metric values, dict
+		"""
+		result = {}
+		if tree is not None:
+			result.update(tree.calculate(value, [x for x in self.metrics
+			                                     if x in Dendrogram.METRICS]))
+		if _collection is not None:
+			result.update(m_pipe.run(_collection, initial_collection=collection, **args))
+		return {metric: result[metric] for metric in self.metrics}
+
 
 class TestPipeline(Pipeline):
 	"""
@@ -1,25 +1,27 @@
 import geopandas as gpd
 import numpy as np
+import shapely
 from shapely.affinity import translate, scale
 from shapely.geometry import Point, Polygon, MultiPolygon, MultiPoint, LineString,\
 	GeometryCollection
+from shapely.ops import unary_union
 import sys
 
 sys.path.append('scripts/')
-from config import GEOMETRY_TYPE
-from utils import geom_check, validate_polygon
+from config import GEOMETRY_TYPE, BUFFER_QUAD_SEGS, BUFFER_JOIN_STYLE, PRECISION_GRID, \
+	SIMPLIFY_TOLERANCE
+from utils import geom_check, validate_polygon, geometry_array, repair_polygons, UnionFind
 
 # from metrics import *
 
 
-# IDEA: put number of initial elements inside each cluster into the collection
-# and update this value as the cluster grows
-
 class Collection:
 	# TESTED: collection_test.py
 	def __init__(self, class_type):
 		self.collection = []
 		self.class_type = class_type
+		# cluster index of every original footprint, set by the growth engines
+		self.labels = None
 
 	def __iter__(self):
 		return Iterator(self.collection, self.class_type)
@@ -46,6 +48,51 @@ class Collection:
 				raise TypeError
 
 
+def polygon_array(collection):
+	"""
+	Function that collects the polygons of a collection for vectorized calls
+	:param collection: collection of Footprints, Collection
+	:return: polygons, np.array of Polygon
+	"""
+	return geometry_array([x.polygon for x in collection.collection])
+
+
+def convex_hull(collection):
+	"""
+	Function that finds the convex hull around all the footprints of a
+	collection from their vertices
+	:param collection: collection of Footprints, Collection
+	:return: convex hull, Polygon
+	"""
+	coordinates = shapely.get_coordinates(polygon_array(collection))
+	return shapely.convex_hull(shapely.multipoints(coordinates))
+
+
+def membership(collection, initial_collection):
+	"""
+	Function that finds the cluster of the collection that contains every
+	footprint of the initial collection, using the labels set by the growth
+	engines
+	:param collection: grown collection, Collection
+	:param initial_collection: collection the growth started from, Collection
+	:return: cluster index of every initial footprint, np.array of int, or None
+	if the labels of the collections do not say it
+	"""
+	if collection is initial_collection:
+		return np.arange(len(collection))
+	if collection.labels is None:
+		return None
+	if initial_collection.labels is None:
+		if len(collection.labels) == len(initial_collection):
+			return collection.labels
+		return None
+	if len(initial_collection.labels) != len(collection.labels):
+		return None
+	result = np.zeros(len(initial_collection), dtype=np.int64)
+	result[initial_collection.labels] = collection.labels
+	return result
+
+
 class Iterator:
 	def __init__(self, collection, class_type):
 		self.collection = collection
@@ -70,14 +117,101 @@ class Iterator:
 
 
 class Reader:
-	def __init__(self):
+	"""
+	Class that reads building geometries. Invalid geometries are repaired in
+	bulk as they are read; repaired counts them over all the reads.
+	"""
+	def __init__(self, chunksize=10000):
+		"""
+		:param chunksize: number of features read at once when streaming, int
+		"""
 		self.n = 0
+		self.repaired = 0
+		self.chunksize = chunksize
+		self.mixed = {}
 
 	def read(self, shapefile):
 		assert isinstance(shapefile, str)
 		df = gpd.read_file(shapefile)
 		df = geom_check(df, GEOMETRY_TYPE)
-		return [x for x in df['geometry']]
+		return self._repair(list(df.index), list(df['geometry']))[1]
+
+	def _repair(self, ids, geometries):
+		"""
+		Function that repairs the invalid geometries and drops the ones that
+		collapse
+		:return: feature ids and geometries, tuple of lists
+		"""
+		geometries, repaired = repair_polygons(geometries)
+		self.repaired += repaired
+		if repaired == 0:
+			return ids, geometries
+		keep = ~shapely.is_empty(geometry_array(geometries))
+		return [x for x, y in zip(ids, keep) if y], [x for x, y in zip(geometries, keep) if y]
+
+	def _chunks(self, shapefile, bbox=None):
+		"""
+		Generator that reads the geometries of a shapefile chunk by chunk, with
+		pyogrio, the only engine that reads a slice of the rows without the
+		attribute table
+		:return: geometries, generator of GeoDataFrame
+		"""
+		start = 0
+		while True:
+			df = gpd.read_file(shapefile, bbox=bbox, columns=[], fid_as_index=True,
+			                   rows=slice(start, start + self.chunksize), engine='pyogrio')
+			start += len(df)
+			yield df
+			if len(df) < self.chunksize:
+				break
+
+	def is_mixed(self, shapefile):
+		"""
+		Function that tells whether a shapefile mixes GEOMETRY_TYPE with other
+		geometry types, which makes geom_check drop the others. It is decided
+		once per file, with a pass over all its geometries, so that every chunk
+		and every bounding box is filtered like a full read.
+		:param shapefile: path to the shapefile, str
+		:return: bool
+		"""
+		if shapefile not in self.mixed:
+			types = set()
+			for df in self._chunks(shapefile):
+				types.update(x == GEOMETRY_TYPE for x in df.geom_type)
+				if len(types) > 1:
+					break
+			self.mixed[shapefile] = len(types) > 1
+		return self.mixed[shapefile]
+
+	def stream(self, shapefile, bbox=None):
+		"""
+		Generator that reads the geometries of a shapefile chunk by chunk, without
+		the attribute table. The geometry type filter of geom_check is decided
+		for the whole file and applied to every chunk.
+		:param shapefile: path to the shapefile, str
+		:param bbox: (minx, miny, maxx, maxy), only the features whose bounding
+		box intersects it are read, tuple
+		:return: feature ids and geometries of every chunk, generator of (list, list)
+		"""
+		assert isinstance(shapefile, str)
+		mixed = self.is_mixed(shapefile)
+		for df in self._chunks(shapefile, bbox):
+			df = geom_check(df, GEOMETRY_TYPE, mixed)
+			ids, geometries = self._repair(list(df.index), list(df['geometry']))
+			self.n += len(geometries)
+			if len(geometries) > 0:
+				yield ids, geometries
+
+	def read_bbox(self, shapefile, bbox):
+		"""
+		Function that reads only the features inside a bounding box
+		:return: feature ids and geometries, tuple of lists
+		"""
+		ids, geometries = [], []
+		for _ids, _geometries in self.stream(shapefile, bbox):
+			ids += _ids
+			geometries += _geometries
+		return ids, geometries
 
 
 class Footprint:
@@ -85,14 +219,20 @@ class Footprint:
 	Class that represents a building footprint.
 	TESTED: footprint_test.py
 	"""
-	def __init__(self, polygon):
+	def __init__(self, polygon, valid=False):
 		"""
 		:param polygon: building footprint, Polygon
+		:param valid: the polygon is known to be valid, like the ones the growth
+		engine makes, and is not checked again. MultiPolygons are still joined
+		into one Polygon, bool
 		"""
 		if not (isinstance(polygon, Polygon) or isinstance(polygon, MultiPolygon)):
 			print('Expected Polygon type, got {}'.format(type(polygon)))
 			raise TypeError
-		self.polygon = validate_polygon(polygon)
+		if valid and polygon.geom_type == 'Polygon':
+			self.polygon = polygon
+		else:
+			self.polygon = validate_polygon(polygon)
 
 	def grow(self, value):
 		"""
@@ -100,7 +240,8 @@ class Footprint:
 		:param value: offset value, int or float
 		:return: new footprint with offset polygon, Footprint
 		"""
-		return Footprint(self.polygon.buffer(value))
+		return Footprint(self.polygon.buffer(value, quad_segs=BUFFER_QUAD_SEGS,
+		                                     join_style=BUFFER_JOIN_STYLE), valid=True)
 
 
 class Uniter:
@@ -111,13 +252,132 @@ class Uniter:
 		new = Collection(Footprint)
 		for element1 in collection:
 			if element1.polygon.intersects(footprint.polygon):
-				footprint = Footprint(element1.polygon.union(footprint.polygon))
+				footprint = Footprint(element1.polygon.union(footprint.polygon), valid=True)
 			else:
 				new.add(element1)
 		new.add(footprint)
 		return new
 
 
+class ComponentUniter:
+	"""
+	Merges intersecting polygons in one pass. Intersecting pairs are found
+	with an STRtree, clusters are grouped with union-find and every cluster
+	is merged with a single unary_union. The result matches what repeated
+	Uniter.make calls produce, in the same order.
+	"""
+	def __init__(self):
+		self.name = 'component_uniter'
+
+	def make(self, polygons, labels=None):
+		"""
+		:param polygons: polygons to merge, np.array of Polygon
+		:param labels: index of the polygon that contains every original
+		footprint, np.array of int
+		:return: merged clusters with the cluster index of every original
+		footprint as labels, Collection
+		"""
+		new = Collection(Footprint)
+		if len(polygons) == 0:
+			return new
+		clusters = self.label(polygons)
+		new.labels = clusters if labels is None else clusters[labels]
+		labels = clusters
+		order = np.argsort(labels, kind='stable')
+		bounds = np.flatnonzero(np.diff(labels[order])) + 1
+		for members in np.split(order, bounds):
+			if len(members) == 1:
+				new.add(Footprint(polygons[members[0]], valid=True))
+			else:
+				new.add(Footprint(unary_union(polygons[members]), valid=True))
+		return new
+
+	def merge(self, geometries):
+		"""
+		Function that builds footprints from raw geometries and merges them.
+		Validity is checked in one vectorized call and only the invalid
+		geometries go through validate_polygon.
+		:param geometries: building geometries, list of Polygon
+		:return: merged clusters, Collection
+		"""
+		collection = Collection(Footprint)
+		valid = shapely.is_valid(geometry_array(geometries)).tolist() if len(geometries) else []
+		collection.add([Footprint(x, valid=y) for x, y in zip(geometries, valid)])
+		return self.make(polygon_array(collection))
+
+	def label(self, polygons):
+		"""
+		Function that assigns each polygon to its cluster
+		:param polygons: polygons to group, np.array of Polygon
+		:return: cluster label of each polygon, np.array of int
+		"""
+		tree = shapely.STRtree(polygons)
+		left, right = tree.query(polygons, predicate='intersects')
+		union_find = UnionFind(len(polygons))
+		for i, j in zip(left[left < right].tolist(), right[left < right].tolist()):
+			union_find.union(i, j)
+		return union_find.labels()
+
+
+class Grower:
+	"""
+	Growth engine that buffers the whole collection in one batch and merges
+	the grown footprints with ComponentUniter. The merged clusters can be
+	snapped to a precision grid and simplified, so that the arc vertices do
+	not pile up over the iterations. The settings default to config.
+	"""
+	def __init__(self, quad_segs=None, join_style=None, grid_size=None, tolerance=None):
+		"""
+		:param quad_segs: buffer segments per quarter circle, int
+		:param join_style: buffer join style, 'round', 'mitre' or 'bevel'
+		:param grid_size: precision grid size, float
+		:param tolerance: simplification tolerance, float
+		"""
+		self.name = 'grower'
+		self.quad_segs = BUFFER_QUAD_SEGS if quad_segs is None else quad_segs
+		self.join_style = BUFFER_JOIN_STYLE if join_style is None else join_style
+		self.grid_size = PRECISION_GRID if grid_size is None else grid_size
+		self.tolerance = SIMPLIFY_TOLERANCE if tolerance is None else tolerance
+
+	def make(self, collection, value):
+		"""
+		:param collection: collection of Footprints, Collection
+		:param value: offset value, int or float
+		:return: grown and merged clusters, Collection
+		"""
+		if len(collection) == 0:
+			return Collection(Footprint)
+		polygons = shapely.buffer(polygon_array(collection), value,
+		                          quad_segs=self.quad_segs, join_style=self.join_style)
+		new = ComponentUniter().make(polygons, collection.labels)
+		if self.tolerance:
+			new = Simplifier().make(new, self.tolerance)
+		if self.grid_size:
+			new = Snapper().make(new, self.grid_size)
+		return new
+
+
+
+class PairwiseGrower:
+	"""
+	Growth engine that grows the footprints one by one and merges them
+	through Uniter. Kept as the reference implementation.
+	"""
+	def __init__(self):
+		self.name = 'pairwise_grower'
+
+	def make(self, collection, value):
+		"""
+		:param collection: collection of Footprints, Collection
+		:param value: offset value, int or float
+		:return: grown and merged clusters, Collection
+		"""
+		new = Collection(Footprint)
+		for element in collection:
+			new = Uniter().make(new, element.grow(value))
+		return new
+
+
 class Shifter:
 	def __init__(self):
 		self.name = 'shifter'
@@ -127,7 +387,9 @@ class Shifter:
 		if len(collection) > 0:
 			min_x, min_y = self.get_min(collection)
 			for footprint in collection:
-				new.add(Footprint(translate(footprint.polygon, xoff=-min_x, yoff=-min_y)))
+				new.add(Footprint(translate(footprint.polygon, xoff=-min_x, yoff=-min_y),
+				                  valid=True))
+		new.labels = collection.labels
 		return new
 
 	def get_min(self, collection):
@@ -147,6 +409,49 @@ class Shifter:
 		return max_x, max_y
 
 
+class Simplifier:
+	"""
+	Simplifies every footprint of a collection with a given tolerance,
+	preserving the topology unless told otherwise. Without it the plain
+	Douglas-Peucker algorithm is used, which is several times faster; the
+	few footprints it splits or makes invalid are simplified again with the
+	topology preserved, so they stay one polygon within the tolerance of the
+	original instead of being joined back by Footprint.
+	"""
+	def __init__(self):
+		self.name = 'simplifier'
+
+	def make(self, collection, tolerance, preserve_topology=True):
+		new = Collection(Footprint)
+		if len(collection) > 0:
+			originals = polygon_array(collection)
+			polygons = shapely.simplify(originals, tolerance, preserve_topology=preserve_topology)
+			invalid = ~shapely.is_valid(polygons) | (shapely.get_type_id(polygons) != 3)
+			if np.any(invalid):
+				polygons[invalid] = shapely.simplify(originals[invalid], tolerance,
+				                                     preserve_topology=True)
+			valid = shapely.is_valid(polygons).tolist()
+			new.add([Footprint(x, valid=y) for x, y in zip(polygons, valid)])
+		new.labels = collection.labels
+		return new
+
+
+class Snapper:
+	"""
+	Snaps every footprint of a collection to a precision grid.
+	"""
+	def __init__(self):
+		self.name = 'snapper'
+
+	def make(self, collection, grid_size):
+		new = Collection(Footprint)
+		if len(collection) > 0:
+			polygons = shapely.set_precision(polygon_array(collection), grid_size)
+			new.add([Footprint(polygon, valid=True) for polygon in polygons])
+		new.labels = collection.labels
+		return new
+
+
 class Scaler:
 	def __init__(self):
 		self.name = 'scaler'
@@ -161,7 +466,8 @@ class Scaler:
 		new = Collection(Footprint)
 		for footprint in collection:
 			new.add(Footprint(scale(footprint.polygon, xfact=1 / pol_scale,
-			                        yfact=1 / pol_scale, origin=(0, 0))))
+			                        yfact=1 / pol_scale, origin=(0, 0)), valid=True))
+		new.labels = collection.labels
 		return new
 
 
@@ -169,10 +475,12 @@ class Iteration:
 	"""
 	Class that represents one algorithm iteration.
 	"""
-	def __init__(self, collection, value):
+	def __init__(self, collection, value, grower=None):
 		"""
 		:param collection: collection of Footprints, Collection class
 		:param value: value of buffer, int or float
+		:param grower: growth engine, Grower by default
+		of the process
 		"""
 		if not (isinstance(value, int) or isinstance(value, float)):
 			print("expected value to be numeric, got {}".format(type(value)))
@@ -187,6 +495,7 @@ class Iteration:
 		self.value = value
 		# self.calculator = Calculator()
 		self.collection = collection
+		self.grower = grower if grower is not None else Grower()
 		self.new_collection = Collection(Footprint)
 
 	def make(self):
@@ -197,9 +506,7 @@ class Iteration:
 		return self.calculator.calculate(polygon1, polygon2)
 
 	def _make(self):
-		for element in self.collection:
-			self.new_collection = Uniter().make(self.new_collection,
-			                                    element.grow(self.value))
+		self.new_collection = self.grower.make(self.collection, self.value)
 		# return self._calculate_metrics(polygon1, polygon2)
 		del self.collection
 		return self.new_collection
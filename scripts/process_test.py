@@ -0,0 +1,77 @@
+import os
+import tempfile
+import unittest
+import geopandas as gpd
+import pandas as pd
+import shapely
+import sys
+sys.path.append('scripts/')
+from pipeline import GridPipeline, ProcessMetricsPipeline
+from writer import ColumnarWriter, process_filename, read_results
+
+
+class ProcessTest(unittest.TestCase):
+	"""
+	Tests for the process metrics of a whole grid run
+	"""
+	FILENAME = 'test_shapefiles/test.shp'
+	FIELDS = ['cluster_number', 'total_area', 'total_perimeter']
+
+	def setUp(self):
+		self.folder = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.folder.cleanup()
+
+	def _path(self, name):
+		return os.path.join(self.folder.name, name)
+
+	def _results(self):
+		clusters = {2: [9, 5, 5, 2, 1], 0: [3, 1], 1: [1]}
+		return {cell: {i: {'cluster_number': x, 'total_area': 10.5 * (i + 1) + cell,
+		                   'total_perimeter': 4. * x + i}
+		               for i, x in enumerate(values)}
+		        for cell, values in clusters.items()}
+
+	def test_select(self):
+		self.assertEqual(ProcessMetricsPipeline.select(['cluster_number', 'hindex']),
+		                 ['cluster_number'])
+		self.assertEqual(ProcessMetricsPipeline.select(self.FIELDS, ['total_perimeter']),
+		                 ['total_perimeter'])
+		with self.assertRaises(AssertionError):
+			ProcessMetricsPipeline.select(['cluster_number'], ['total_area'])
+
+	def test_run_grid(self):
+		results = self._results()
+		pipe = ProcessMetricsPipeline(None, self.FIELDS)
+		writer = ColumnarWriter(self._path('grid'), self.FIELDS)
+		process_writer = ColumnarWriter(process_filename(writer.filename),
+		                                ProcessMetricsPipeline.names(self.FIELDS), keys=['cell'])
+		for cell, result in results.items():
+			for i, values in result.items():
+				writer.add((cell, i), values)
+			process_writer.add((cell,), pipe.run(result))
+		writer.save()
+		process_writer.save()
+		expected = read_results(process_writer.filename).set_index('cell').sort_index()
+		result = pipe.run_grid(read_results(writer.filename))
+		self.assertEqual(list(result.index), [0, 1, 2])
+		self.assertEqual(list(result.columns), list(expected.columns))
+		self.assertEqual(result.to_dict(orient='index'), expected.to_dict(orient='index'))
+
+	def test_grid_process_fields(self):
+		bounds = gpd.read_file(self.FILENAME).total_bounds
+		grid = self._path('grid.shp')
+		gpd.GeoDataFrame(geometry=[shapely.box(*bounds)], crs='EPSG:3857').to_file(grid)
+		fields = ['cluster_number', 'total_perimeter']
+		pipe = GridPipeline(self.FILENAME, output=self._path('grid.ndjson'), metrics=fields,
+		                    process_fields=['total_perimeter'])
+		pipe.run(grid)
+		expected = read_results(process_filename(pipe.output)).set_index('cell')
+		self.assertEqual(list(expected.columns), ProcessMetricsPipeline.names(['total_perimeter']))
+		result = ProcessMetricsPipeline(None, ['total_perimeter']).run_grid(read_results(pipe.output))
+		pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
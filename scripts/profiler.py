@@ -0,0 +1,241 @@
+import copy
+from functools import wraps
+import inspect
+import json
+import numpy as np
+import os
+import shapely
+import sys
+import threading
+from time import perf_counter
+
+sys.path.append('scripts/')
+import executor
+import metrics
+import pipeline
+import polygon
+import visualizer
+import writer
+
+
+class Profiler:
+	"""
+	Class that records the wall time of the pipelines, iterations, metrics
+	and writers of a run and saves it as a Chrome trace.
+	The methods are wrapped by install and restored by uninstall, so nothing
+	is recorded and nothing is paid for unless the profiler is installed.
+	Every event carries the cell and iteration it belongs to and the number
+	of clusters and vertices of the collection it worked on. Events recorded
+	in the worker processes of a pool travel back with the task results; a
+	worker that does not inherit the installed profiler, as under the spawn
+	start method, installs its own through the pool initializer.
+	Events are recorded per thread, so the reading and writing stages of a
+	grid run show up next to the computing one.
+	"""
+	def __init__(self):
+		self.events = []
+		self._local = threading.local()
+		self.pid = os.getpid()
+		self.start = perf_counter()
+		self._installed = []
+
+	@property
+	def context(self):
+		"""
+		:return: cell and iteration the current thread works on, dict
+		"""
+		if not hasattr(self._local, 'context'):
+			self._local.context = {}
+		return self._local.context
+
+	@context.setter
+	def context(self, context):
+		self._local.context = context
+
+	def targets(self):
+		"""
+		:return: the methods to wrap, list of (class, method name, event name)
+		"""
+		targets = []
+		for name, cls in vars(pipeline).items():
+			if isinstance(cls, type) and issubclass(cls, pipeline.Pipeline) and 'run' in vars(cls):
+				targets.append((cls, 'run', '{}.run'.format(name)))
+		targets += [(pipeline.MainPipeline, '_iterate', 'MainPipeline.iteration'),
+		            (pipeline.MainPipeline, '_calculate', 'MainPipeline.calculate'),
+		            (polygon.Iteration, 'make', 'Iteration.make'),
+		            (visualizer.Visualizer, 'render', 'Visualizer.render'),
+		            (metrics.Metric, 'calculate', None),
+		            (metrics.CMetric, 'calculate', None)]
+		for cls in [writer.CsvWriter, writer.ColumnarWriter, writer.LabelWriter,
+		            writer.JsonWriter, writer.Manifest, visualizer.FrameWriter]:
+			for method in ['add', 'flush', 'save', 'close']:
+				if method in vars(cls):
+					targets.append((cls, method, '{}.{}'.format(cls.__name__, method)))
+		return targets
+
+	def install(self):
+		"""
+		Function that wraps the profiled methods
+		:return: profiler, Profiler
+		"""
+		for cls, method, name in self.targets():
+			function = vars(cls)[method]
+			self._installed.append((cls, method, function))
+			setattr(cls, method, self._wrap(function, name))
+		for name in ['run_cell', 'run_iteration']:
+			function = getattr(pipeline, name)
+			self._installed.append((pipeline, name, function))
+			setattr(pipeline, name, self._task(function))
+		function = executor.Executor.map
+		self._installed.append((executor.Executor, 'map', function))
+		executor.Executor.map = self._map(function)
+		return self
+
+	def uninstall(self):
+		for owner, name, function in reversed(self._installed):
+			setattr(owner, name, function)
+		self._installed = []
+
+	def _wrap(self, function, name):
+		signature = inspect.signature(function)
+		profiler = self
+
+		@wraps(function)
+		def wrapper(*args, **kwargs):
+			bound = signature.bind(*args, **kwargs).arguments
+			instance = args[0]
+			context = dict(profiler.context)
+			if isinstance(instance, pipeline.MainPipeline) and name == 'MainPipeline.run':
+				profiler.context['cell'] = instance.filename
+			if 'value' in bound and isinstance(instance, pipeline.MainPipeline):
+				profiler.context['iter'] = bound['value']
+			output = None
+			start = perf_counter()
+			try:
+				output = function(*args, **kwargs)
+				return output
+			finally:
+				elapsed = perf_counter() - start
+				event = name if name is not None else 'metric.{}'.format(instance.name)
+				profiler.record(event, start, elapsed, instance, bound, output)
+				profiler.context = context
+		return wrapper
+
+	def _task(self, function):
+		"""
+		Function that wraps a task function, so that in a worker process the
+		events of the task are returned with its result
+		"""
+		profiler = self
+
+		@wraps(function)
+		def wrapper(task):
+			first = len(profiler.events)
+			result = function(task)
+			if os.getpid() == profiler.pid:
+				return result
+			events = profiler.events[first:]
+			del profiler.events[first:]
+			return ProfiledResult(result, events)
+		return wrapper
+
+	def _map(self, function):
+		profiler = self
+
+		@wraps(function)
+		def wrapper(instance, task_function, tasks):
+			instance = copy.copy(instance)
+			instance.initializer, instance.initargs = install_worker, \
+				(profiler.pid, instance.initializer, instance.initargs)
+			for result in function(instance, task_function, tasks):
+				if isinstance(result, ProfiledResult):
+					profiler.events += result.events
+					result = result.result
+				yield result
+		return wrapper
+
+	def record(self, name, start, elapsed, instance, arguments, output=None):
+		"""
+		Function that adds a complete event in Chrome trace format
+		:param name: event name, str
+		:param start: perf_counter at the start of the call, float
+		:param elapsed: wall time in seconds, float
+		:param instance: object the method was called on
+		:param arguments: arguments of the call by name, dict
+		:param output: value the call returned
+		"""
+		args = dict(self.context)
+		collection = self._collection(instance, arguments, output)
+		if collection is not None:
+			args['clusters'] = len(collection)
+			args['vertices'] = vertices(collection)
+		self.events.append({'name': name, 'cat': name.split('.')[0], 'ph': 'X',
+		                    'ts': (start - self.start) * 1e6, 'dur': elapsed * 1e6,
+		                    'pid': os.getpid(), 'tid': threading.get_native_id(),
+		                    'args': args})
+
+	def _collection(self, instance, arguments, output):
+		"""
+		Function that finds the collection a call worked on: the one it made,
+		the grown one it was given, or the one of its instance
+		"""
+		if isinstance(output, tuple) and len(output) > 0:
+			output = output[0]
+		candidates = [output, arguments.get('_collection'), arguments.get('collection'),
+		              getattr(instance, 'collection', None)]
+		for collection in candidates:
+			if isinstance(collection, polygon.Collection) and \
+					collection.class_type is polygon.Footprint:
+				return collection
+		return None
+
+	def summary(self):
+		"""
+		:return: calls, total and longest wall time in seconds per event name, dict
+		"""
+		result = {}
+		for event in self.events:
+			row = result.setdefault(event['name'], {'calls': 0, 'seconds': 0., 'max': 0.})
+			row['calls'] += 1
+			row['seconds'] += event['dur'] / 1e6
+			row['max'] = max(row['max'], event['dur'] / 1e6)
+		return dict(sorted(result.items(), key=lambda x: -x[1]['seconds']))
+
+	def save(self, filename):
+		"""
+		Function that saves the events in Chrome trace format, to be opened
+		in chrome://tracing or Perfetto, with the summary next to them
+		:param filename: path of the trace, str
+		"""
+		with open(filename, 'w') as f:
+			json.dump({'traceEvents': self.events, 'displayTimeUnit': 'ms',
+			           'summary': self.summary()}, f, default=str)
+		print('trace saved as {}'.format(filename))
+
+
+def install_worker(pid, initializer=None, initargs=()):
+	"""
+	Function that installs a profiler in a worker process that imported the
+	modules afresh, so that its events travel back with the task results, and
+	then calls the initializer of the pool. A forked worker, or the process
+	of a serial executor, already runs the installed profiler.
+	:param pid: id of the process the profiler was installed in, int
+	:param initializer: initializer of the pool, function
+	:param initargs: arguments of the initializer, tuple
+	"""
+	if not hasattr(pipeline.run_cell, '__wrapped__'):
+		profiler = Profiler()
+		profiler.pid = pid
+		profiler.install()
+	if initializer is not None:
+		initializer(*initargs)
+
+
+class ProfiledResult:
+	def __init__(self, result, events):
+		self.result = result
+		self.events = events
+
+
+def vertices(collection):
+	return int(np.sum(shapely.get_num_coordinates(polygon.polygon_array(collection))))
@@ -0,0 +1,63 @@
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
+import unittest
+import shapely
+from shapely.geometry import Polygon
+import sys
+sys.path.append('scripts/')
+from metrics import Metric, ClusterNumberMetric
+from pipeline import run_cell
+from polygon import Collection, Footprint, Iteration
+from profiler import Profiler, ProfiledResult, install_worker
+
+
+class ProfilerTest(unittest.TestCase):
+	"""
+	Tests for the run profiler
+	"""
+	def _collection(self):
+		collection = Collection(Footprint)
+		collection.add(Footprint(Polygon([(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)])))
+		collection.add(Footprint(Polygon([(3, 0), (3, 1), (4, 1), (4, 0), (3, 0)])))
+		return collection
+
+	def test_events(self):
+		profiler = Profiler().install()
+		try:
+			grown = Iteration(self._collection(), 2).make()
+			ClusterNumberMetric().calculate(grown)
+		finally:
+			profiler.uninstall()
+		self.assertEqual([x['name'] for x in profiler.events],
+		                 ['Iteration.make', 'metric.cluster_number'])
+		self.assertEqual(profiler.events[0]['args'], {
+			'clusters': 1, 'vertices': sum(shapely.get_num_coordinates(x.polygon) for x in grown)})
+		self.assertEqual(profiler.events[0]['ph'], 'X')
+		self.assertEqual(profiler.summary()['metric.cluster_number']['calls'], 1)
+
+	def test_spawned_worker(self):
+		buildings = [x.polygon for x in self._collection()]
+		task = (0, [0, 1], buildings, shapely.box(-1, -1, 5, 2),
+		        {'export_csv': False, 'metrics': ['cluster_number']})
+		context = multiprocessing.get_context('spawn')
+		with ProcessPoolExecutor(1, mp_context=context, initializer=install_worker,
+		                         initargs=(os.getpid(),)) as pool:
+			result = pool.submit(run_cell, task).result()
+		self.assertIsInstance(result, ProfiledResult)
+		self.assertIn('MainPipeline.run', [x['name'] for x in result.events])
+		self.assertEqual(result.result[1], None)
+
+	def test_uninstall(self):
+		calculate, make = Metric.calculate, Iteration.make
+		profiler = Profiler().install()
+		self.assertIsNot(Metric.calculate, calculate)
+		profiler.uninstall()
+		self.assertIs(Metric.calculate, calculate)
+		self.assertIs(Iteration.make, make)
+		ClusterNumberMetric().calculate(self._collection())
+		self.assertEqual(profiler.events, [])
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -0,0 +1,62 @@
+import os
+import tempfile
+import unittest
+import geopandas as gpd
+from shapely.geometry import MultiPolygon, Polygon
+import sys
+sys.path.append('scripts/')
+from polygon import Reader
+
+
+class ReaderTest(unittest.TestCase):
+	"""
+	Tests for the streaming shapefile reader
+	"""
+	FILENAME = 'test_shapefiles/test.shp'
+
+	def test_stream(self):
+		chunks = list(Reader(chunksize=10).stream(self.FILENAME))
+		self.assertEqual(len(chunks), 8)
+		geometries = [x for _, chunk in chunks for x in chunk]
+		self.assertEqual([x.wkb for x in geometries],
+		                 [x.wkb for x in Reader().read(self.FILENAME)])
+
+	def test_read_bbox(self):
+		geometries = Reader().read(self.FILENAME)
+		bbox = geometries[0].bounds
+		ids, buildings = Reader().read_bbox(self.FILENAME, bbox)
+		self.assertIn(0, ids)
+		self.assertEqual([x.wkb for x in buildings], [geometries[i].wkb for i in ids])
+
+	def test_stream_mixed(self):
+		folder = tempfile.TemporaryDirectory()
+		filename = os.path.join(folder.name, 'mixed.shp')
+		squares = [Polygon([(x, 0), (x, 1), (x + 1, 1), (x + 1, 0), (x, 0)]) for x in range(0, 8, 2)]
+		multi = [MultiPolygon([Polygon([(x, 5), (x, 6), (x + 1, 6)]),
+		                       Polygon([(x, 8), (x, 9), (x + 1, 9)])]) for x in range(0, 8, 2)]
+		gpd.GeoDataFrame(geometry=squares + multi, crs='EPSG:3857').to_file(filename)
+		reader = Reader(chunksize=4)
+		self.assertTrue(reader.is_mixed(filename))
+		geometries = [x for _, chunk in reader.stream(filename) for x in chunk]
+		self.assertEqual([x.wkb for x in geometries], [x.wkb for x in Reader().read(filename)])
+		self.assertEqual([x.wkb for x in geometries], [x.wkb for x in squares])
+		self.assertEqual(reader.read_bbox(filename, (0, 4, 8, 10)), ([], []))
+		folder.cleanup()
+
+	def test_repair(self):
+		folder = tempfile.TemporaryDirectory()
+		filename = os.path.join(folder.name, 'invalid.shp')
+		bowtie = Polygon([(0, 0), (0, 2), (1, 1), (2, 2), (2, 0), (1, 1), (0, 0)])
+		square = Polygon([(5, 0), (5, 1), (6, 1), (6, 0), (5, 0)])
+		gpd.GeoDataFrame(geometry=[bowtie, square], crs='EPSG:3857').to_file(filename)
+		reader = Reader()
+		geometries = reader.read(filename)
+		self.assertEqual(reader.repaired, 1)
+		self.assertTrue(all(x.is_valid for x in geometries))
+		self.assertEqual(geometries[0].geom_type, 'MultiPolygon')
+		self.assertEqual(geometries[1].wkb, square.wkb)
+		folder.cleanup()
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
@@ -0,0 +1,81 @@
+from multiprocessing.shared_memory import SharedMemory
+import numpy as np
+import shapely
+import sys
+
+sys.path.append('scripts/')
+from utils import geometry_array
+
+# blocks this process has attached to, by name, so that every worker
+# attaches once per run instead of once per task
+_blocks = {}
+
+
+class SharedGeometries:
+	"""
+	Class that encodes the buildings of a run once as WKB in a shared memory
+	block, so that the tasks of a process pool only carry building ids.
+	The block holds the number of buildings, the offsets of their WKB and
+	the WKB one after another. Pickling keeps the name of the block only;
+	the workers attach to it on first use and decode the buildings of a
+	cell when they are asked for.
+	The process that made the block has to close it once the workers are done.
+	"""
+	def __init__(self, geometries):
+		"""
+		:param geometries: buildings, list of Polygon
+		"""
+		wkb = shapely.to_wkb(geometry_array(geometries)) if len(geometries) \
+			else np.zeros(0, dtype=object)
+		offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+		np.cumsum([len(x) for x in wkb], out=offsets[1:])
+		header = 8 * (len(offsets) + 1)
+		self.block = SharedMemory(create=True, size=max(header + int(offsets[-1]), 1))
+		self.name = self.block.name
+		self.owner = True
+		np.ndarray(1, dtype=np.int64, buffer=self.block.buf)[0] = len(wkb)
+		np.ndarray(len(offsets), dtype=np.int64, buffer=self.block.buf, offset=8)[:] = offsets
+		self.block.buf[header:header + int(offsets[-1])] = b''.join(wkb)
+
+	def __getstate__(self):
+		return {'name': self.name}
+
+	def __setstate__(self, state):
+		self.name = state['name']
+		self.block = None
+		self.owner = False
+
+	def __len__(self):
+		return int(np.ndarray(1, dtype=np.int64, buffer=self._attach().buf)[0])
+
+	def get(self, ids):
+		"""
+		Function that decodes some of the buildings
+		:param ids: building ids, positions in the list the block was made of, list of int
+		:return: buildings, list of Polygon
+		"""
+		buffer = self._attach().buf
+		n = int(np.ndarray(1, dtype=np.int64, buffer=buffer)[0])
+		offsets = np.ndarray(n + 1, dtype=np.int64, buffer=buffer, offset=8)
+		header = 8 * (n + 2)
+		starts = offsets[ids] + header
+		ends = offsets[np.asarray(ids, dtype=np.int64) + 1] + header
+		wkb = np.array([bytes(buffer[x:y]) for x, y in zip(starts.tolist(), ends.tolist())],
+		               dtype=object)
+		return list(shapely.from_wkb(wkb)) if len(wkb) else []
+
+	def close(self):
+		"""
+		Function that frees the block, in the process that made it
+		"""
+		if self.owner and self.block is not None:
+			self.block.close()
+			self.block.unlink()
+			self.block = None
+
+	def _attach(self):
+		if self.block is None:
+			if self.name not in _blocks:
+				_blocks[self.name] = SharedMemory(name=self.name)
+			self.block = _blocks[self.name]
+		return self.block
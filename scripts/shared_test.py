@@ -0,0 +1,54 @@
+import os
+import pickle
+import unittest
+import shapely
+from shapely.geometry import Polygon
+import sys
+sys.path.append('scripts/')
+from shared import SharedGeometries
+
+
+class SharedGeometriesTest(unittest.TestCase):
+	"""
+	Tests for the buildings shared between processes
+	"""
+	def _geometries(self):
+		return [Polygon([(0, 0), (0, 1), (1, 1), (1, 0), (0, 0)]),
+		        Polygon([(0, 0), (0, 4), (4, 4), (4, 0), (0, 0)],
+		                [[(1, 1), (1, 2), (2, 2), (2, 1), (1, 1)]]),
+		        Polygon([(5, 5), (5, 6), (6, 5), (5, 5)])]
+
+	def test_get(self):
+		geometries = self._geometries()
+		shared = SharedGeometries(geometries)
+		try:
+			self.assertEqual(len(shared), 3)
+			for geometry, expected in zip(shared.get([2, 0]), [geometries[2], geometries[0]]):
+				self.assertTrue(shapely.equals_exact(geometry, expected, 0))
+			self.assertEqual(shared.get([]), [])
+		finally:
+			shared.close()
+
+	def test_pickle(self):
+		geometries = self._geometries()
+		shared = SharedGeometries(geometries)
+		try:
+			payload = pickle.dumps(shared)
+			self.assertLess(len(payload), 200)
+			copy = pickle.loads(payload)
+			self.assertTrue(shapely.equals_exact(copy.get([1])[0], geometries[1], 0))
+			copy.close()
+			self.assertIsNotNone(shared.block)
+		finally:
+			shared.close()
+		self.assertFalse(os.path.exists('/dev/shm/' + shared.name.lstrip('/')))
+
+	def test_empty(self):
+		shared = SharedGeometries([])
+		self.assertEqual(len(shared), 0)
+		self.assertEqual(shared.get([]), [])
+		shared.close()
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
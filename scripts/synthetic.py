@@ -0,0 +1,61 @@
+import numpy as np
+import shapely
+
+
+class SyntheticCity:
+	"""
+	Seeded generator of building footprints.
+	Footprints are star-shaped polygons around their centre, so they are
+	always valid. Their centres are spread uniformly over a square, except for
+	a share of them that is gathered around random cluster centres. The side
+	of the square follows from the number of footprints and the density, the
+	share of the square that size x size squares would cover.
+	"""
+	def __init__(self, n=100, density=0.2, clustering=0.5, vertices=4, size=10., seed=0):
+		"""
+		:param n: number of footprints, int
+		:param density: covered share of the square, float in (0, 1]
+		:param clustering: share of footprints gathered around cluster centres, float in [0, 1]
+		:param vertices: number of vertices of every footprint, int >= 3
+		:param size: mean footprint diameter in map units, float
+		:param seed: random seed, int
+		"""
+		assert n > 0, "Expected a positive number of footprints, got {}".format(n)
+		assert 0 < density <= 1, "Expected density in (0, 1], got {}".format(density)
+		assert 0 <= clustering <= 1, "Expected clustering in [0, 1], got {}".format(clustering)
+		assert vertices >= 3, "Expected at least 3 vertices, got {}".format(vertices)
+		self.n = n
+		self.density = density
+		self.clustering = clustering
+		self.vertices = vertices
+		self.size = size
+		self.seed = seed
+
+	def extent(self):
+		"""
+		:return: side of the square the footprints are spread over, float
+		"""
+		return float(np.sqrt(self.n * self.size ** 2 / self.density))
+
+	def make(self):
+		"""
+		:return: footprints, list of Polygon
+		"""
+		rng = np.random.default_rng(self.seed)
+		centres = self._centres(rng)
+		angles = (np.arange(self.vertices) + rng.uniform(-0.3, 0.3, (self.n, self.vertices))) \
+			* 2 * np.pi / self.vertices + rng.uniform(0, 2 * np.pi, (self.n, 1))
+		radii = self.size / 2 * rng.uniform(0.6, 1., (self.n, self.vertices))
+		coordinates = np.stack([np.cos(angles), np.sin(angles)], axis=-1) * radii[..., None]
+		return list(shapely.polygons(coordinates + centres[:, None, :]))
+
+	def _centres(self, rng):
+		side = self.extent()
+		centres = rng.uniform(0, side, (self.n, 2))
+		clustered = rng.random(self.n) < self.clustering
+		n_clusters = max(1, self.n // 20)
+		seeds = rng.uniform(0, side, (n_clusters, 2))
+		spread = side / (4 * np.sqrt(n_clusters))
+		centres[clustered] = seeds[rng.integers(0, n_clusters, np.sum(clustered))] + \
+			rng.normal(0, spread, (np.sum(clustered), 2))
+		return np.clip(centres, 0, side)
@@ -0,0 +1,37 @@
+import unittest
+import numpy as np
+import shapely
+import sys
+sys.path.append('scripts/')
+from synthetic import SyntheticCity
+
+
+class SyntheticCityTest(unittest.TestCase):
+	"""
+	Tests for the synthetic footprint generator
+	"""
+	def test_seeded(self):
+		first = SyntheticCity(50, seed=4).make()
+		self.assertEqual([x.wkb for x in first], [x.wkb for x in SyntheticCity(50, seed=4).make()])
+		self.assertNotEqual([x.wkb for x in first], [x.wkb for x in SyntheticCity(50, seed=5).make()])
+
+	def test_footprints(self):
+		city = SyntheticCity(500, vertices=7)
+		footprints = np.array(city.make())
+		self.assertEqual(len(footprints), 500)
+		self.assertTrue(np.all(shapely.is_valid(footprints)))
+		self.assertTrue(np.all(shapely.get_num_coordinates(footprints) == 8))
+		xmin, ymin, xmax, ymax = shapely.total_bounds(footprints)
+		self.assertGreaterEqual(xmin, -city.size / 2)
+		self.assertLessEqual(xmax, city.extent() + city.size / 2)
+
+	def test_density(self):
+		self.assertEqual(SyntheticCity(100, density=0.25, size=10).extent(), 200)
+		sparse = np.array(SyntheticCity(500, density=0.05, clustering=0).make())
+		dense = np.array(SyntheticCity(500, density=0.5, clustering=0).make())
+		self.assertLess(len(shapely.STRtree(sparse).query(sparse, predicate='intersects')[0]),
+		                len(shapely.STRtree(dense).query(dense, predicate='intersects')[0]))
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
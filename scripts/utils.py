@@ -1,30 +1,55 @@
 import numpy as np
 import pandas as pd
+import shapely
 
 from shapely.geometry import Point, Polygon, MultiPolygon
 from shapely.validation import explain_validity
 from shapely.ops import unary_union
 
 
-def geom_check(df, dtype):
-	_geom_check = [1 if x.geom_type != dtype else 0 for x in df['geometry']]
-	if len(np.unique(_geom_check)) > 1:
+def geom_check(df, dtype, mixed=None):
+	"""
+	Function that keeps only the geometries of the given type when the
+	geometry types are mixed
+	:param df: geometries, GeoDataFrame
+	:param dtype: geometry type to keep, str
+	:param mixed: whether the file df was read from mixes the type with
+	others, decided from df itself if None, bool
+	:return: filtered geometries, GeoDataFrame
+	"""
+	if mixed is None:
+		mixed = len(np.unique([1 if x.geom_type != dtype else 0 for x in df['geometry']])) > 1
+	if mixed:
 		df = df.loc[df['geometry'].geom_type == dtype]
 	return df
 
 
-def polygon_to_contour(polygon):
-	polygon = validate_polygon(polygon)
-	coords = [x for x in polygon.exterior.coords]
-	return [[[int(x[0]), int(x[1])]] for x in coords]
+def geometry_array(geometries):
+	"""
+	Function that packs geometries into an object array for vectorized calls
+	:param geometries: geometries, list
+	:return: geometries, np.array of object
+	"""
+	array = np.empty(len(geometries), dtype=object)
+	array[:] = list(geometries)
+	return array
 
-def polygon_to_internal_contour(polygon):
-	polygon = validate_polygon(polygon)
-	holes = []
-	for interior in polygon.interiors:
-		holes.append([[[int(x[0]), int(x[1])]] for x in interior.coords])
 
-	return holes
+def repair_polygons(geometries):
+	"""
+	Function that repairs the invalid geometries in one vectorized pass with
+	make_valid, keeping only their polygonal parts. A geometry that collapses
+	entirely comes back empty.
+	:param geometries: geometries, list
+	:return: repaired geometries and number of repairs, tuple
+	"""
+	array = geometry_array(geometries)
+	invalid = ~shapely.is_valid(array)
+	if np.any(invalid):
+		array[invalid] = shapely.make_valid(array[invalid], method='structure',
+		                                    keep_collapsed=False)
+	return list(array), int(np.sum(invalid))
+
 
 def validate_polygon(polygon):
 	if polygon.geom_type == 'Polygon':
@@ -35,8 +60,9 @@ def validate_polygon(polygon):
 			if n >= 10:
 				break
 	elif polygon.geom_type == 'MultiPolygon':
-		p1 = polygon.geoms[0]
-		for p in polygon.geoms[1:]:
+		parts = list(polygon.geoms)
+		p1 = parts[0]
+		for p in parts[1:]:
 			if p.geom_type == 'Polygon':
 				dist = p1.distance(p) + 0.001
 				p1 = unary_union([p1.buffer(dist), p.buffer(dist)])
@@ -46,3 +72,58 @@ def validate_polygon(polygon):
 	return polygon
 
 
+class UnionFind:
+	"""
+	Disjoint-set forest that groups elements connected by pairwise links.
+	"""
+	def __init__(self, n):
+		"""
+		:param n: number of elements, int
+		"""
+		self.parent = list(range(n))
+
+	def find(self, i):
+		"""
+		Function that finds the root of the set containing an element
+		:param i: element index, int
+		:return: root index, int
+		"""
+		root = i
+		while self.parent[root] != root:
+			root = self.parent[root]
+		while self.parent[i] != root:
+			self.parent[i], i = root, self.parent[i]
+		return root
+
+	def union(self, i, j):
+		"""
+		Function that merges the sets containing two elements
+		:param i: element index, int
+		:param j: element index, int
+		:return: True if the sets were different, bool
+		"""
+		root_i, root_j = self.find(i), self.find(j)
+		if root_i == root_j:
+			return False
+		if root_i < root_j:
+			self.parent[root_j] = root_i
+		else:
+			self.parent[root_i] = root_j
+		return True
+
+	def labels(self):
+		"""
+		Function that numbers the sets in the order Uniter would produce them:
+		a cluster ends up after the last footprint that joined it.
+		:return: set label of each element, np.array of int
+		"""
+		roots = np.array([self.find(i) for i in range(len(self.parent))], dtype=np.int64)
+		if len(roots) == 0:
+			return roots
+		last = np.zeros(len(roots), dtype=np.int64)
+		np.maximum.at(last, roots, np.arange(len(roots)))
+		unique_roots = np.unique(roots)
+		order = unique_roots[np.argsort(last[unique_roots], kind='stable')]
+		rank = np.zeros(len(roots), dtype=np.int64)
+		rank[order] = np.arange(len(order))
+		return rank[roots]
@@ -0,0 +1,154 @@
+import argparse
+import numpy as np
+import pandas as pd
+import shapely
+import sys
+import textwrap
+from time import time
+
+sys.path.append('scripts/')
+from config import INCREMENTAL_TOLERANCE, METRICS
+from metrics import ClusterNumberMetric, TotalAreaMetric, TotalPerimeterMetric
+from pipeline import CollectionPipeline, IterPipeline, MetricsPipeline
+from polygon import Simplifier, Snapper, Grower, convex_hull, polygon_array
+
+
+class DriftReport:
+	"""
+	Class that compares the exact growth, where every iteration grows the
+	original footprints, with the incremental growth, where every iteration
+	grows the clusters of the previous one by one step, simplifies them by
+	INCREMENTAL_TOLERANCE and snaps them to a grid of the same size.
+	"""
+	def __init__(self, filename):
+		"""
+		:param filename: path to the shapefile to inspect, str
+		"""
+		self.filename = filename
+
+	def make(self, max_iterations=200):
+		"""
+		Function that grows the collection in both modes until a unique cluster
+		is formed and reports the area and perimeter drift on every iteration
+		:param max_iterations: iteration limit, int
+		:return: one row per iteration, pd.DataFrame
+		"""
+		collection = CollectionPipeline(self.filename).run()
+		hull = convex_hull(collection)
+		rows = []
+		previous = collection
+		for i in range(1, max_iterations + 1):
+			exact = IterPipeline(self.filename, i).run(collection)
+			incremental = Simplifier().make(IterPipeline(self.filename, 1).run(previous),
+			                                INCREMENTAL_TOLERANCE, preserve_topology=False)
+			incremental = Snapper().make(incremental, INCREMENTAL_TOLERANCE)
+			row = {'iter': i}
+			for mode, _collection in [('exact', exact), ('incremental', incremental)]:
+				row['{}_clusters'.format(mode)] = ClusterNumberMetric().calculate(_collection)
+				row['{}_area'.format(mode)] = TotalAreaMetric().calculate(_collection, hull=hull)
+				row['{}_perimeter'.format(mode)] = TotalPerimeterMetric().calculate(_collection)
+			for metric in ['area', 'perimeter']:
+				drift = row['incremental_{}'.format(metric)] - row['exact_{}'.format(metric)]
+				row['{}_drift'.format(metric)] = drift
+				row['{}_relative_drift'.format(metric)] = drift / row['exact_{}'.format(metric)]
+			rows.append(row)
+			previous = incremental
+			if row['exact_clusters'] == 1 and row['incremental_clusters'] == 1:
+				break
+		return pd.DataFrame(rows).set_index('iter')
+
+
+class ResolutionReport:
+	"""
+	Class that compares growth settings (buffer segments, join style, precision
+	grid and simplification) with the exact growth, which uses the default
+	round buffer and no snapping. For every setting and iteration it reports
+	the number of vertices, the time spent and the relative error of the metrics.
+	"""
+	SETTINGS = {'exact': {},
+	            'quad_segs_8': {'quad_segs': 8},
+	            'quad_segs_4': {'quad_segs': 4},
+	            'quad_segs_2': {'quad_segs': 2},
+	            'grid_0.01': {'grid_size': 0.01},
+	            'grid_0.1': {'grid_size': 0.1},
+	            'simplify_0.05': {'tolerance': 0.05},
+	            'simplify_0.2': {'tolerance': 0.2},
+	            'quad_segs_4_grid_0.1': {'quad_segs': 4, 'grid_size': 0.1}}
+
+	def __init__(self, filename, settings=None):
+		"""
+		:param filename: path to the shapefile to inspect, str
+		:param settings: Grower arguments by setting name, dict
+		"""
+		self.filename = filename
+		self.settings = self.SETTINGS if settings is None else settings
+		self.metrics = [x for x in METRICS if x != 'distance_matrix']
+
+	def make(self, max_iterations=200):
+		"""
+		:param max_iterations: iteration limit, int
+		:return: one row per setting and iteration, pd.DataFrame
+		"""
+		collection = CollectionPipeline(self.filename).run()
+		hull = convex_hull(collection)
+		m_pipe = MetricsPipeline(self.filename, self.metrics)
+		reference = {}
+		rows = []
+		for i in range(1, max_iterations + 1):
+			exact = IterPipeline(self.filename, i, Grower(16, 'round', 0, 0)).run(collection)
+			reference[i] = m_pipe.run(exact, initial_collection=collection, hull=hull)
+			if reference[i]['cluster_number'] == 1:
+				break
+		for name, setting in self.settings.items():
+			grower = Grower(**setting)
+			for i, expected in reference.items():
+				start = time()
+				_collection = IterPipeline(self.filename, i, grower).run(collection)
+				elapsed = time() - start
+				result = m_pipe.run(_collection, initial_collection=collection, hull=hull)
+				row = {'setting': name, 'iter': i, 'seconds': elapsed,
+				       'vertices': int(np.sum(shapely.get_num_coordinates(
+					       polygon_array(_collection))))}
+				for metric in self.metrics:
+					error = abs(result[metric] - expected[metric])
+					row['{}_error'.format(metric)] = error / abs(expected[metric]) \
+						if expected[metric] else error
+				rows.append(row)
+		return pd.DataFrame(rows).set_index(['setting', 'iter'])
+
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(
+		formatter_class=argparse.RawDescriptionHelpFormatter,
+		description=textwrap.dedent('''\
+				USAGE: python scripts/validation.py area.shp
+
+				------------------------------------------------------------------------
+
+				Reports the area and perimeter drift of the incremental growth
+				against the exact growth, or with --resolution the vertex counts
+				and metric errors of coarser growth settings.
+
+				------------------------------------------------------------------------
+
+				'''))
+
+	parser.add_argument('filename', type=str, nargs='?',
+	                    default='test_shapefiles/test.shp',
+	                    help='path to the shapefile to inspect')
+	parser.add_argument('--output', type=str, default=None,
+	                    help='path to save the report as csv')
+	parser.add_argument('--resolution', action='store_true',
+	                    help='compare buffer resolution and precision settings')
+
+	############################################################################
+
+	args = parser.parse_args()
+
+	if args.resolution:
+		report = ResolutionReport(args.filename).make()
+	else:
+		report = DriftReport(args.filename).make()
+	print(report.to_string())
+	if args.output:
+		report.to_csv(args.output)
@@ -1,48 +1,144 @@
 import cv2
-import geopandas as gpd
-import math
 import numpy as np
 import os
-from shapely.affinity import translate, scale
-from shapely.geometry import Point, Polygon, MultiPolygon, MultiPoint, LineString,\
-	GeometryCollection
-from shapely.validation import explain_validity
-from shapely.ops import unary_union
+from queue import Queue
+import shapely
 import sys
+from threading import Thread
 
 sys.path.append('scripts/')
 from config import CANVAS
-from polygon import Scaler, Shifter
-from utils import polygon_to_contour, polygon_to_internal_contour
+from polygon import polygon_array
 
 
 class Visualizer:
-	def __init__(self, collection, name='result'):
+	"""
+	Class that draws a collection on a canvas, scaled so that it fits the
+	canvas from its bottom left corner.
+	The exteriors of all the footprints are filled with one fillPoly call and
+	their holes are cleared with another one.
+	"""
+	def __init__(self, collection, name='result', writer=None):
+		"""
+		:param collection: collection of Footprints, Collection
+		:param name: name of the image, str
+		:param writer: writer that saves the frame in the background, FrameWriter;
+		the image is saved to vis/<name>.png right away without it
+		"""
 		self.collection = collection
 		self.canvas = CANVAS
 		assert isinstance(name, str), "Expected name to be str, got {}".format(type(name))
 		self.name = name
+		self.writer = writer
 
 	def visualize(self):
 		return self._visualize()
 
 	def _visualize(self):
-		self.collection = Scaler().make(self.collection, self.canvas)
-		# limits = Shifter().get_max(self.collection)
-		# base = np.zeros((math.ceil(limits[1]), math.ceil(limits[0])))
-		base = np.zeros(self.canvas)
-		contours, holes = [], []
-		for footprint in self.collection:
-			contours.append(polygon_to_contour(footprint.polygon))
-			holes.append(polygon_to_internal_contour(footprint.polygon))
-		for c in contours:
-			base = cv2.drawContours(base, np.array([c]),
-			                        -1, (255, 255, 255), -1)
-		for hole_group in holes:
-			for hole in hole_group:
-				base = cv2.drawContours(base, np.array([hole]), -1, (0, 0, 0), -1)
-		if not 'vis' in os.listdir():
-			os.mkdir('vis')
-		cv2.imwrite('vis/{}.png'.format(self.name), base)
+		base = self.render()
+		if self.writer is not None:
+			self.writer.add(self.name, base)
+		else:
+			os.makedirs('vis', exist_ok=True)
+			cv2.imwrite('vis/{}.png'.format(self.name), base)
 		return base
 
+	def render(self):
+		"""
+		:return: image of the collection, np.array of uint8 of the canvas shape
+		"""
+		base = np.zeros(self.canvas, dtype=np.uint8)
+		polygons = shapely.get_parts(polygon_array(self.collection))
+		if len(polygons) == 0:
+			return base
+		xmin, ymin, xmax, ymax = shapely.total_bounds(polygons)
+		factor = max((xmax - xmin) / self.canvas[1], (ymax - ymin) / self.canvas[0])
+		if factor == 0:
+			factor = 1
+		rings, index = shapely.get_rings(polygons, return_index=True)
+		exterior = np.ones(len(rings), dtype=bool)
+		exterior[1:] = np.diff(index) != 0
+		for selection, colour in [(exterior, 255), (~exterior, 0)]:
+			if np.any(selection):
+				cv2.fillPoly(base, contours(rings[selection], (xmin, ymin), factor), colour)
+		return base
+
+
+def contours(rings, origin, factor):
+	"""
+	Function that converts rings to pixel contours in one vectorized pass
+	:param rings: rings, np.array of LinearRing
+	:param origin: coordinates of the canvas corner, tuple
+	:param factor: map units per pixel, float
+	:return: pixel coordinates of every ring, list of np.array of int32
+	"""
+	coordinates, index = shapely.get_coordinates(rings, return_index=True)
+	points = ((coordinates - origin) / factor).astype(np.int32)
+	return np.split(points, np.flatnonzero(np.diff(index)) + 1)
+
+
+class FrameWriter:
+	"""
+	Class that saves frames on a background thread, either as one png per
+	frame in vis/ or as a single video vis/<name>.mp4.
+	Frames are queued up to maxsize, so the iterations only wait for the
+	thread when it falls that far behind.
+	"""
+	def __init__(self, name='result', video=False, fps=2, maxsize=8):
+		"""
+		:param name: name of the video, str
+		:param video: save the frames into one video instead of pngs, bool
+		:param fps: frames per second of the video, int
+		:param maxsize: number of frames queued before add blocks, int
+		"""
+		self.name = name
+		self.video = video
+		self.fps = fps
+		self.queue = Queue(maxsize=maxsize)
+		self.error = None
+		self._video = None
+		os.makedirs('vis', exist_ok=True)
+		self.thread = Thread(target=self._work, daemon=True)
+		self.thread.start()
+
+	def add(self, name, frame):
+		"""
+		:param name: name of the frame, str
+		:param frame: image, np.array of uint8
+		"""
+		if self.error is not None:
+			raise self.error
+		self.queue.put((name, frame))
+
+	def close(self):
+		"""
+		Function that waits until all the queued frames are saved
+		"""
+		self.queue.put(None)
+		self.thread.join()
+		if self.error is not None:
+			raise self.error
+
+	def _work(self):
+		while True:
+			item = self.queue.get()
+			if item is None:
+				break
+			if self.error is not None:
+				continue
+			try:
+				self._save(*item)
+			except Exception as e:
+				self.error = e
+		if self._video is not None:
+			self._video.release()
+
+	def _save(self, name, frame):
+		if not self.video:
+			cv2.imwrite('vis/{}.png'.format(name), frame)
+			return
+		if self._video is None:
+			self._video = cv2.VideoWriter('vis/{}.mp4'.format(self.name),
+			                              cv2.VideoWriter_fourcc(*'mp4v'), self.fps,
+			                              (frame.shape[1], frame.shape[0]), isColor=False)
+		self._video.write(frame)
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+import cv2
+import numpy as np
+from shapely.geometry import Polygon
+import sys
+sys.path.append('scripts/')
+from polygon import Collection, Footprint
+from visualizer import Visualizer, FrameWriter
+
+
+class VisualizerTest(unittest.TestCase):
+	"""
+	Tests for the collection rasterization and the background frame writer
+	"""
+	def _collection(self):
+		collection = Collection(Footprint)
+		collection.add(Footprint(Polygon([(0, 0), (0, 10), (10, 10), (10, 0), (0, 0)],
+		                                  [[(2, 2), (2, 8), (8, 8), (8, 2), (2, 2)]])))
+		collection.add(Footprint(Polygon([(20, 0), (20, 10), (30, 10), (30, 0), (20, 0)])))
+		return collection
+
+	def test_render(self):
+		base = Visualizer(self._collection()).render()
+		self.assertEqual(base.shape, (600, 600))
+		self.assertEqual(base.dtype, np.uint8)
+		self.assertEqual(base[10, 10], 255)
+		self.assertEqual(base[100, 100], 0)
+		self.assertEqual(base[100, 500], 255)
+		self.assertEqual(base[300, 300], 0)
+
+	def test_frame_writer(self):
+		folder = os.getcwd()
+		with tempfile.TemporaryDirectory() as tmp:
+			os.chdir(tmp)
+			try:
+				frames = FrameWriter('cell')
+				base = Visualizer(self._collection()).render()
+				frames.add('cell_1_iter', base)
+				frames.close()
+				self.assertTrue(np.array_equal(cv2.imread('vis/cell_1_iter.png', 0), base))
+				frames = FrameWriter('cell', video=True)
+				for _ in range(3):
+					frames.add('cell_1_iter', base)
+				frames.close()
+				video = cv2.VideoCapture('vis/cell.mp4')
+				self.assertEqual(video.get(cv2.CAP_PROP_FRAME_COUNT), 3)
+				video.release()
+			finally:
+				os.chdir(folder)
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)
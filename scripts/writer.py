@@ -1,4 +1,6 @@
+import geopandas as gpd
 import json
+import numpy as np
 import os
 import pandas as pd
 import sys
@@ -55,66 +57,395 @@ class Writer:
 
 class JsonWriter(Writer):
 	"""
-	Class that saves results in json format.
+	Class that saves results in json lines format, one line per instance.
+	Every save appends the instances to the file.
 	"""
 	def __init__(self, filename='test'):
 		Writer.__init__(self, filename)
-		if not self.filename.endswith('.json'):
-			self.filename += '.json'
-		# with open(self.filename, 'r') as f:
-		# 	self.content = json.load(f)
+		if not self.filename.endswith(('.json', '.jsonl')):
+			self.filename += '.jsonl'
 		self.content = {}
 
 	def save(self):
 		"""
-		Function that saves the writer's content to local system in json format.
+		Function that appends the writer's content to local system in json lines format.
 		:return:
 		"""
 		with open(self.filename, 'a') as json_file:
-			json.dump(self.content, json_file)
+			for instance, result in self.content.items():
+				json_file.write(json_line({'instance': instance, 'result': result}))
 
 
 class CsvWriter:
+	"""
+	Class that saves the results of one area in csv format, one row per instance.
+	Rows are kept until the writer is saved and written at once.
+	"""
 	def __init__(self, filename='result', features=[]):
 		assert isinstance(filename, str), "Expected name to be str, got {}".format(filename)
 
 		self.filename = filename
 		self.features = features
 		self.content = {}
-		if self.filename + '.csv' in os.listdir():
-			self.csv = pd.read_csv(self.filename + '.csv', index_col=0)
-			# self.csv = self.csv.to_dict(orient='list')
-		else:
-			self.csv = {}
-			self.reset()
-			self.csv = pd.DataFrame(self.csv)
-			self.csv.to_csv(self.filename + '.csv', mode='w')
-			print('csv saved as {}.csv'.format(self.filename))
 
 	def add(self, instance, result):
 		if self._check(result):
 			for _feature in list(result.keys()):
-				if _feature not in list(self.csv.keys()):
+				if _feature not in self.features:
 					return ValueError
 			self.content[instance] = result
 
-			result = {key: [value] for key, value in result.items()}
-
-			_df = pd.DataFrame.from_dict(result)
-			self.csv = self.csv.append(_df, ignore_index=True)
-
 	def _check(self, result):
 		return len(list(result.keys())) == len(self.features)
 
 	def save(self):
-		df = pd.DataFrame(self.csv)
-		df.to_csv(self.filename + '.csv', mode='a', header=False)
+		df = pd.DataFrame(list(self.content.values()), columns=self.features)
+		numeric = df.select_dtypes(include='number').columns
+		df[numeric] = df[numeric].astype(float)
+		# arrays would be written summarized, the way numpy prints them
+		for column in df.columns.difference(numeric):
+			df[column] = [x.tolist() if isinstance(x, np.ndarray) else x for x in df[column]]
+		df.to_csv(self.filename + '.csv', mode='w')
+		print('csv saved as {}.csv'.format(self.filename))
 
 	def reset(self):
-		self.csv = {}
-		# self.csv['iter'] = []
+		self.content = {}
+
+
+class ColumnarWriter:
+	"""
+	Class that saves the results of a whole run in a single file, one row per
+	instance keyed by the key columns, e.g. cell id and iteration.
+	Rows are buffered in preallocated column arrays and flushed in bulk when
+	the buffer is full. A column holds int64 while its values are integers,
+	float64 once a float comes and objects once anything else comes. Files
+	ending with .parquet are written with pyarrow, any other file in json
+	lines format. The parquet schema is the one of the first flush; later
+	rows are cast to it, and rows that cannot be are rejected.
+	"""
+	def __init__(self, filename='result', features=[], keys=['cell', 'iter'],
+	             capacity=4096, append=False):
+		"""
+		:param filename: path of the output file, .ndjson is added without extension, str
+		:param features: result fields, list of str
+		:param keys: key columns of every row, list of str
+		:param capacity: number of rows buffered before a flush, int
+		:param append: append to an existing file instead of replacing it, bool
+		"""
+		assert isinstance(filename, str), "Expected name to be str, got {}".format(filename)
+		assert capacity > 0, "Expected a positive capacity, got {}".format(capacity)
+		if not filename.endswith(('.ndjson', '.jsonl', '.parquet')):
+			filename += '.ndjson'
+		self.filename = filename
+		self.format = 'parquet' if filename.endswith('.parquet') else 'ndjson'
+		assert not (append and self.format == 'parquet'), "Parquet files cannot be appended"
+		if self.format == 'parquet':
+			# fail before any row is computed rather than at the first flush
+			try:
+				import pyarrow.parquet
+			except ImportError:
+				print('Writing {} needs pyarrow, install it or use a .ndjson output'.format(filename))
+				raise
+		self.features = features
+		self.keys = keys
+		self.capacity = capacity
+		self.mode = 'a' if append else 'w'
+		self.size = 0
+		self.columns = {column: np.empty(capacity, dtype=object) for column in keys}
+		self._parquet = None
+
+	def add(self, key, result):
+		"""
+		:param key: values of the key columns, tuple
+		:param result: value of every feature, dict {feature: value}
+		"""
+		if self.size == self.capacity:
+			self.flush()
+		for column, value in zip(self.keys, key):
+			self.columns[column][self.size] = value
 		for feature in self.features:
-			self.csv[feature] = []
+			value = result[feature]
+			dtype = _dtype(value)
+			if feature not in self.columns:
+				self.columns[feature] = np.empty(self.capacity, dtype=dtype)
+			elif dtype != self.columns[feature].dtype != object:
+				# int64 and float64 make float64, anything else makes the column hold objects
+				types = {dtype, self.columns[feature].dtype}
+				dtype = np.dtype(np.float64) if types == {np.dtype(np.int64), np.dtype(np.float64)} \
+					else np.dtype(object)
+				if dtype != self.columns[feature].dtype:
+					self.columns[feature] = self.columns[feature].astype(dtype)
+			self.columns[feature][self.size] = value
+		self.size += 1
+
+	def flush(self):
+		"""
+		Function that writes the buffered rows to the file and empties the buffer
+		"""
+		if self.size == 0:
+			return
+		columns = self.keys + [x for x in self.features if x in self.columns]
+		if self.format == 'parquet':
+			self._flush_parquet(columns)
+		else:
+			rows = zip(*[self.columns[column][:self.size].tolist() for column in columns])
+			with open(self.filename, self.mode) as f:
+				f.writelines(json_line(dict(zip(columns, row))) for row in rows)
+			self.mode = 'a'
+		self.size = 0
+
+	def _flush_parquet(self, columns):
+		import pyarrow as pa
+		import pyarrow.parquet as pq
+		table = pa.Table.from_pandas(pd.DataFrame(
+			{column: self.columns[column][:self.size] for column in columns}),
+			preserve_index=False)
+		if self._parquet is None:
+			self._parquet = pq.ParquetWriter(self.filename, table.schema)
+		elif table.schema != self._parquet.schema:
+			try:
+				table = table.cast(self._parquet.schema)
+			except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError) as e:
+				print('The rows do not match the schema of {}: {}'.format(self.filename, e))
+				raise ValueError
+		self._parquet.write_table(table)
+
+	def save(self):
+		"""
+		Function that flushes the buffered rows and closes the file. A json
+		lines file is created even without rows, so that every run leaves one.
+		"""
+		self.flush()
+		if self.format == 'ndjson':
+			open(self.filename, self.mode).close()
+			self.mode = 'a'
+		if self._parquet is not None:
+			self._parquet.close()
+			self._parquet = None
+
+
+class Manifest:
+	"""
+	Class that records the completed cells of a grid run, the files they
+	were saved to, and the size of the run files once the last completed
+	cell was written. It is replaced atomically after every cell, so an
+	interrupted run can be resumed from it.
+	"""
+	def __init__(self, filename, run=None):
+		"""
+		:param filename: path of the manifest, str
+		:param run: settings that identify the run, dict
+		"""
+		assert isinstance(filename, str), "Expected name to be str, got {}".format(filename)
+		self.filename = filename
+		self.content = {'run': {} if run is None else run, 'sizes': {}, 'cells': {}}
+
+	def load(self, strict=True):
+		"""
+		Function that reads the manifest of a previous run, if there is one.
+		The run settings have to match the ones of the manifest.
+		:param strict: check the run settings, bool
+		:return: manifest, Manifest
+		"""
+		if not os.path.exists(self.filename):
+			return self
+		with open(self.filename) as f:
+			content = json.load(f)
+		if strict and content['run'] != self.content['run']:
+			print('Manifest {} belongs to another run: {}'.format(self.filename, content['run']))
+			raise ValueError
+		self.content = content
+		return self
+
+	def cells(self):
+		"""
+		:return: completed cells, set of int
+		"""
+		return {int(x) for x in self.content['cells']}
+
+	def add(self, cell, outputs, files):
+		"""
+		Function that records a completed cell
+		:param cell: cell index, int
+		:param outputs: files that only belong to the cell, list of str
+		:param files: run files the cell was appended to, list of str
+		"""
+		self.content['cells'][str(cell)] = outputs
+		for filename in files:
+			self.content['sizes'][filename] = os.path.getsize(filename)
+
+	def skip(self, cells, total):
+		"""
+		Function that records the cells that had no buildings once the run is
+		over, with the number of cells of the grid
+		:param cells: cells without buildings, list of int
+		:param total: number of grid cells, int
+		"""
+		self.content['empty'] = sorted(int(x) for x in cells)
+		self.content['grid_cells'] = total
+
+	def truncate(self, files):
+		"""
+		Function that drops everything that was appended to the run files
+		after the last completed cell. A file shorter than the manifest
+		records lost rows of completed cells, so the run cannot be resumed.
+		:param files: run files, list of str
+		"""
+		for filename in files:
+			size = self.content['sizes'].get(filename, 0)
+			current = os.path.getsize(filename) if os.path.exists(filename) else 0
+			if current < size:
+				print('{} holds {} bytes, the manifest records {}: it cannot be resumed'.format(
+					filename, current, size))
+				raise ValueError
+			if os.path.exists(filename):
+				with open(filename, 'r+b') as f:
+					f.truncate(size)
+
+	def save(self):
+		temporary = self.filename + '.tmp'
+		with open(temporary, 'w') as f:
+			json.dump(self.content, f)
+			f.flush()
+			os.fsync(f.fileno())
+		os.replace(temporary, self.filename)
+
+
+def process_filename(filename):
+	"""
+	:param filename: path of the metrics of a grid run, str
+	:return: path of its process metrics, str
+	"""
+	name, extension = os.path.splitext(filename)
+	return '{}_process{}'.format(name, extension)
+
+
+def shard_filename(filename, shard):
+	"""
+	:param filename: path of the metrics of a grid run, str
+	:param shard: shard number, from 1, and number of shards, tuple of int
+	:return: path of the metrics of the shard, str
+	"""
+	name, extension = os.path.splitext(filename)
+	return '{}.shard-{}-of-{}{}'.format(name, shard[0], shard[1], extension)
+
+
+def merge_results(filenames, output, keys, sizes=None):
+	"""
+	Function that merges ColumnarWriter files that hold different cells into
+	one file, ordered by cell, the rows of every cell in their own order.
+	Json lines are copied as they are, so the merged file is the one a single
+	run saves.
+	:param filenames: files to merge, list of str
+	:param output: merged file, str
+	:param keys: key columns, the cell first, list of str
+	:param sizes: number of bytes of every json lines file written up to its
+	last completed cell, the rest is ignored, dict {filename: int}
+	:return: cells of every file, none for a missing file, list of set of int
+	"""
+	if output.endswith('.parquet'):
+		frames = [read_results(x) if os.path.exists(x) else pd.DataFrame(columns=keys)
+		          for x in filenames]
+		df = pd.concat(frames, ignore_index=True)
+		_check_duplicates(df[keys].itertuples(index=False, name=None))
+		df.sort_values(keys[0], kind='stable').to_parquet(output, index=False)
+		return [set(x[keys[0]].tolist()) for x in frames]
+	rows = []
+	cells = []
+	for filename in filenames:
+		if not os.path.exists(filename):
+			cells.append(set())
+			continue
+		with open(filename, 'rb') as f:
+			lines = f.read(sizes[filename] if sizes and filename in sizes else -1)\
+				.decode().splitlines(keepends=True)
+		values = [json.loads(x) for x in lines]
+		rows += [(x[keys[0]], tuple(x[key] for key in keys), line)
+		         for x, line in zip(values, lines)]
+		cells.append({x[keys[0]] for x in values})
+	_check_duplicates(x[1] for x in rows)
+	rows.sort(key=lambda x: x[0])
+	temporary = output + '.tmp'
+	with open(temporary, 'w') as f:
+		f.writelines(x[2] for x in rows)
+	os.replace(temporary, output)
+	return cells
+
+
+def _check_duplicates(keys):
+	seen = set()
+	duplicates = set()
+	for key in keys:
+		if key in seen:
+			duplicates.add(key)
+		seen.add(key)
+	if duplicates:
+		print('Rows saved more than once: {}'.format(sorted(duplicates)))
+		raise ValueError
+
+
+def read_results(filename):
+	"""
+	Function that reads the file of a ColumnarWriter
+	:param filename: path of the file, str
+	:return: one row per instance, pd.DataFrame
+	"""
+	if filename.endswith('.parquet'):
+		return pd.read_parquet(filename)
+	return pd.read_json(filename, lines=True)
+
+
+def json_line(content):
+	return json.dumps(content, default=_to_json) + '\n'
+
+
+def _to_json(value):
+	if isinstance(value, np.integer):
+		return int(value)
+	if isinstance(value, np.floating):
+		return float(value)
+	if isinstance(value, np.ndarray):
+		return value.tolist()
+	raise TypeError('{} is not json serializable'.format(type(value)))
+
+
+def _is_number(value):
+	return isinstance(value, (int, float, np.integer, np.floating)) and not isinstance(value, bool)
+
+
+def _dtype(value):
+	"""
+	:param value: result value
+	:return: column type the value is kept in by ColumnarWriter, np.dtype
+	"""
+	if not _is_number(value):
+		return np.dtype(object)
+	if isinstance(value, (int, np.integer)):
+		return np.dtype(np.int64)
+	return np.dtype(np.float64)
+
+
+class LabelWriter:
+	"""
+	Class that saves the cluster of every footprint on every iteration,
+	one row per footprint and one column per iteration.
+	"""
+	def __init__(self, filename='membership'):
+		assert isinstance(filename, str), "Expected name to be str, got {}".format(filename)
+		self.filename = filename
+		self.content = {}
+
+	def add(self, instance, labels):
+		"""
+		:param instance: iteration, int or str
+		:param labels: cluster index of every footprint, np.array of int
+		"""
+		self.content[instance] = np.asarray(labels)
+
+	def save(self):
+		df = pd.DataFrame(self.content)
+		df.index.name = 'footprint'
+		df.to_csv(self.filename + '.csv')
 
 
 class ShpWriter:
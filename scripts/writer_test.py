@@ -0,0 +1,181 @@
+import json
+import os
+import tempfile
+import importlib.util
+import unittest
+import numpy as np
+import pandas as pd
+import sys
+sys.path.append('scripts/')
+from writer import ColumnarWriter, CsvWriter, JsonWriter, Manifest, read_results, \
+	merge_results, process_filename, shard_filename
+
+
+class WriterTest(unittest.TestCase):
+	"""
+	Tests for the result writers
+	"""
+	def setUp(self):
+		self.folder = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.folder.cleanup()
+
+	def _path(self, name):
+		return os.path.join(self.folder.name, name)
+
+	def test_columnar_writer(self):
+		writer = ColumnarWriter(self._path('grid'), ['a', 'b'], capacity=2)
+		for cell in range(2):
+			for i in range(3):
+				writer.add((cell, i), {'a': i * 0.5, 'b': [cell]})
+		self.assertEqual(writer.size, 2)
+		writer.save()
+		self.assertEqual(writer.filename, self._path('grid.ndjson'))
+		df = read_results(writer.filename)
+		self.assertEqual(list(df.columns), ['cell', 'iter', 'a', 'b'])
+		self.assertEqual(df['cell'].tolist(), [0, 0, 0, 1, 1, 1])
+		self.assertEqual(df['iter'].tolist(), [0, 1, 2, 0, 1, 2])
+		self.assertEqual(df['a'].tolist(), [0, 0.5, 1, 0, 0.5, 1])
+		self.assertEqual(df['b'].tolist(), [[0]] * 3 + [[1]] * 3)
+
+	def test_columnar_writer_append(self):
+		writer = ColumnarWriter(self._path('grid'), ['a'], keys=['cell'])
+		writer.add((0,), {'a': 1})
+		writer.save()
+		writer = ColumnarWriter(self._path('grid'), ['a'], keys=['cell'], append=True)
+		writer.add((1,), {'a': 2})
+		writer.save()
+		self.assertEqual(read_results(writer.filename)['cell'].tolist(), [0, 1])
+
+	def test_columnar_writer_types(self):
+		writer = ColumnarWriter(self._path('grid'), ['a', 'b', 'c'], capacity=2)
+		writer.add((0, 0), {'a': 5, 'b': np.int64(1), 'c': 2})
+		writer.add((0, 1), {'a': 4, 'b': 1.5, 'c': 2})
+		writer.add((0, 2), {'a': 3, 'b': 2, 'c': None})
+		self.assertEqual(writer.columns['a'].dtype, np.int64)
+		self.assertEqual(writer.columns['b'].dtype, np.float64)
+		self.assertEqual(writer.columns['c'].dtype, object)
+		writer.save()
+		with open(writer.filename) as f:
+			lines = f.readlines()
+		self.assertEqual(json.loads(lines[0]), {'cell': 0, 'iter': 0, 'a': 5, 'b': 1, 'c': 2})
+		self.assertIn('"a": 4,', lines[1])
+		self.assertIn('"b": 2.0,', lines[2])
+		self.assertIn('"c": null', lines[2])
+
+	@unittest.skipUnless(importlib.util.find_spec('pyarrow'), 'needs pyarrow')
+	def test_columnar_writer_parquet(self):
+		writer = ColumnarWriter(self._path('grid.parquet'), ['a', 'b', 'c'], capacity=2)
+		for i in range(3):
+			writer.add((0, i), {'a': 5 - i, 'b': i * 0.5, 'c': np.arange(i, dtype=np.float32)})
+		writer.save()
+		df = read_results(writer.filename)
+		self.assertEqual(df['a'].dtype, np.int64)
+		self.assertEqual(df['a'].tolist(), [5, 4, 3])
+		self.assertEqual(df['b'].tolist(), [0, 0.5, 1])
+		self.assertEqual([list(x) for x in df['c']], [[], [0], [0, 1]])
+		writer = ColumnarWriter(self._path('types.parquet'), ['a'], capacity=1)
+		writer.add((0, 0), {'a': 1})
+		writer.add((0, 1), {'a': 1.5})
+		with self.assertRaises(ValueError):
+			writer.flush()
+
+	def test_columnar_writer_empty(self):
+		writer = ColumnarWriter(self._path('grid'), ['a'])
+		writer.save()
+		self.assertEqual(os.path.getsize(writer.filename), 0)
+
+	def test_manifest(self):
+		writer = ColumnarWriter(self._path('grid'), ['a'], keys=['cell'])
+		manifest = Manifest(self._path('grid.manifest.json'), run={'grid': 'a.shp'})
+		writer.add((0,), {'a': 1})
+		writer.flush()
+		manifest.add(0, [], [writer.filename])
+		manifest.save()
+		writer.add((1,), {'a': 2})
+		writer.flush()
+		manifest = Manifest(self._path('grid.manifest.json'), run={'grid': 'a.shp'}).load()
+		self.assertEqual(manifest.cells(), {0})
+		manifest.truncate([writer.filename])
+		self.assertEqual(read_results(writer.filename)['cell'].tolist(), [0])
+		with self.assertRaises(ValueError):
+			Manifest(self._path('grid.manifest.json'), run={'grid': 'b.shp'}).load()
+
+	def test_manifest_short_file(self):
+		writer = ColumnarWriter(self._path('grid'), ['a'], keys=['cell'])
+		manifest = Manifest(self._path('grid.manifest.json'), run={'grid': 'a.shp'})
+		writer.add((0,), {'a': 1})
+		writer.add((1,), {'a': 2})
+		writer.flush()
+		manifest.add(1, [], [writer.filename])
+		manifest.save()
+		with open(writer.filename, 'r+b') as f:
+			f.truncate(5)
+		manifest = Manifest(self._path('grid.manifest.json'), run={'grid': 'a.shp'}).load()
+		with self.assertRaises(ValueError):
+			manifest.truncate([writer.filename])
+		self.assertEqual(os.path.getsize(writer.filename), 5)
+
+	def test_merge_results(self):
+		filenames = []
+		for shard, cells in [(1, [0, 2]), (2, [1])]:
+			writer = ColumnarWriter(self._path('grid.shard-{}.ndjson'.format(shard)), ['a'])
+			for cell in cells:
+				for i in range(2):
+					writer.add((cell, i), {'a': cell + i / 10})
+			writer.save()
+			filenames.append(writer.filename)
+		sizes = {filenames[0]: os.path.getsize(filenames[0])}
+		with open(filenames[0], 'a') as f:
+			f.write('{"cell": 4, "it')
+		cells = merge_results(filenames, self._path('grid.ndjson'), ['cell', 'iter'], sizes)
+		self.assertEqual(cells, [{0, 2}, {1}])
+		df = read_results(self._path('grid.ndjson'))
+		self.assertEqual(df['cell'].tolist(), [0, 0, 1, 1, 2, 2])
+		self.assertEqual(df['a'].tolist(), [0, 0.1, 1, 1.1, 2, 2.1])
+		with self.assertRaises(ValueError):
+			merge_results(filenames[1:] * 2, self._path('grid.ndjson'), ['cell', 'iter'])
+
+	def test_shard_filename(self):
+		self.assertEqual(shard_filename('result/grid.ndjson', (2, 4)),
+		                 'result/grid.shard-2-of-4.ndjson')
+		self.assertEqual(process_filename('result/grid.shard-2-of-4.ndjson'),
+		                 'result/grid.shard-2-of-4_process.ndjson')
+
+	def test_csv_writer(self):
+		writer = CsvWriter(self._path('cell'), features=['a', 'b'])
+		self.assertFalse(os.path.exists(self._path('cell.csv')))
+		writer.add(0, {'a': 1, 'b': 2.5})
+		writer.add(1, {'a': 2, 'b': 3.5})
+		writer.add(2, {'a': 2})
+		writer.save()
+		df = pd.read_csv(self._path('cell.csv'), index_col=0)
+		self.assertEqual(df.to_dict(orient='list'), {'a': [1., 2.], 'b': [2.5, 3.5]})
+
+	def test_array_results(self):
+		distances = np.arange(2000, dtype=np.float32) / 4
+		writer = CsvWriter(self._path('cell'), features=['d'])
+		writer.add(0, {'d': distances})
+		writer.save()
+		df = pd.read_csv(self._path('cell.csv'), index_col=0)
+		self.assertEqual(json.loads(df['d'][0]), distances.tolist())
+		writer = ColumnarWriter(self._path('grid'), ['d'])
+		writer.add((0, 0), {'d': distances})
+		writer.save()
+		self.assertEqual(read_results(writer.filename)['d'][0], distances.tolist())
+
+	def test_json_writer(self):
+		writer = JsonWriter(self._path('labels'))
+		writer.add('a', {'x': 1})
+		writer.add('b', {'x': 2})
+		writer.save()
+		writer.save()
+		with open(self._path('labels.jsonl')) as f:
+			lines = [json.loads(x) for x in f]
+		self.assertEqual(len(lines), 4)
+		self.assertEqual(lines[1], {'instance': 'b', 'result': {'x': 2}})
+
+
+if __name__ == '__main__':
+	unittest.main(verbosity=2)